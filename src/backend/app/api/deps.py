@@ -0,0 +1,6 @@
+from fastapi import Request
+from app.services.container import ServiceContainer
+
+def get_services(request: Request) -> ServiceContainer:
+    """Returns the service container built in the application lifespan."""
+    return request.app.state.services
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.session import get_db
 from app.db import models
 from app.schemas import admin as schemas
+from app.api.deps import get_services
+from app.services.container import ServiceContainer
+from app.services.evaluation import EvalQuestion
+from app.core.config import settings
 import uuid
-from typing import Optional
+from dataclasses import asdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal, Optional
 
 router = APIRouter()
 
@@ -34,7 +41,8 @@ async def create_tenant(tenant: schemas.TenantCreate, db: AsyncSession = Depends
 async def create_project(
     project: schemas.ProjectCreate, 
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user_from_header)
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Authentication required")
@@ -63,8 +71,7 @@ async def create_project(
     await db.commit()
     await db.refresh(db_project)
     # Ensure vector collection exists
-    from app.services.vector import vector_service
-    vector_service.ensure_collection_exists(str(project.tenant_id), str(db_project.id))
+    await services.rag.ensure_project_index(str(project.tenant_id), str(db_project.id))
     
     return db_project
 
@@ -115,3 +122,193 @@ async def create_user(
     await db.commit()
     await db.refresh(db_user)
     return db_user
+
+async def get_admin_project(
+    project_id: uuid.UUID,
+    db: AsyncSession,
+    current_user: models.User
+) -> models.Project:
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can manage project indexes and evaluations")
+    project = await db.get(models.Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if current_user.tenant_id != project.tenant_id:
+        raise HTTPException(status_code=403, detail="Cross-tenant action denied")
+    return project
+
+def _reindex_status(row: models.ProjectIndex) -> schemas.ReindexStatus:
+    return schemas.ReindexStatus(
+        project_id=row.project_id,
+        collection_name=row.collection_name,
+        embedding_model=row.embedding_model,
+        version=row.version,
+        status=row.reindex_status,
+        target_model=row.shadow_embedding_model,
+        done=row.reindex_done,
+        total=row.reindex_total,
+        error=row.reindex_error
+    )
+
+@router.post("/projects/{project_id}/reindex", response_model=schemas.ReindexStatus)
+async def start_reindex(
+    project_id: uuid.UUID,
+    request: schemas.ReindexRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    project = await get_admin_project(project_id, db, current_user)
+    from app.services.reindex import ReindexError
+    try:
+        row = await services.reindex.start(str(project.tenant_id), str(project.id), request.embedding_model)
+    except (ReindexError, ValueError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Long-running job: owned by the container rather than the request.
+    services.spawn(services.reindex.run(str(project.tenant_id), str(project.id)))
+    return _reindex_status(row)
+
+@router.get("/projects/{project_id}/reindex", response_model=schemas.ReindexStatus)
+async def get_reindex_status(
+    project_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    project = await get_admin_project(project_id, db, current_user)
+    await services.index.resolve(str(project.tenant_id), str(project.id))
+    return _reindex_status(await services.reindex.status(str(project.id)))
+
+@router.delete("/projects/{project_id}/reindex", response_model=schemas.ReindexStatus)
+async def abort_reindex(
+    project_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    project = await get_admin_project(project_id, db, current_user)
+    from app.services.reindex import ReindexError
+    try:
+        shadow_name = await services.reindex.abort(str(project.id))
+    except ReindexError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    services.spawn(services.reindex.drop_aborted(shadow_name))
+    return _reindex_status(await services.reindex.status(str(project.id)))
+
+@router.post("/reconcile", response_model=schemas.ReconcileStarted, status_code=202)
+async def run_reconcile(
+    full: bool = False,
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    if not current_user or current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can run the reconciler")
+    from app.services.reconciler import ReconcileBusy
+    try:
+        token = await services.reconciler.acquire_run_lock()
+    except ReconcileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Scoped to the caller's tenant; the scheduled run covers everything. Re-ingests can
+    # take long, so the run is owned by the container; poll GET /reconcile for the report.
+    tenant_id = str(current_user.tenant_id)
+    services.spawn(services.reconciler.run(full=full, tenant_id=tenant_id, lock_token=token))
+    return schemas.ReconcileStarted(status="started", mode="full" if full else "incremental", tenant_id=tenant_id)
+
+@router.get("/reconcile", response_model=schemas.ReconcileReport)
+async def get_reconcile_report(
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    if not current_user or current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can run the reconciler")
+    report = await services.reconciler.last_report(str(current_user.tenant_id))
+    if report is None:
+        raise HTTPException(status_code=404, detail="No reconcile has run for this tenant yet")
+    return schemas.ReconcileReport(**report)
+
+@router.post("/cache/warm", response_model=schemas.WarmReport)
+async def warm_cache(
+    refresh: bool = False,
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    if not current_user or current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can warm the cache")
+    report = await services.warmer.run(tenant_id=str(current_user.tenant_id), refresh=refresh)
+    return schemas.WarmReport(**asdict(report))
+
+@router.post("/projects/{project_id}/evaluate", response_model=schemas.EvaluationResponse)
+async def evaluate_project(
+    project_id: uuid.UUID,
+    request: schemas.EvaluationRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Runs a question set against the project; same report as `evaluate.py`."""
+    project = await get_admin_project(project_id, db, current_user)
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(request.questions) > settings.EVAL_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions (max {settings.EVAL_MAX_QUESTIONS}); use evaluate.py for larger sets"
+        )
+
+    # Batch work: rate-limited and run in the ingest pool, which yields to chat.
+    await services.admission.check_rate("ingest", str(project.tenant_id), str(current_user.id))
+    services.admission.check_ingest_backlog()
+
+    questions = [
+        EvalQuestion(id=q.id or str(n), question=q.question, expected_sources=q.expected_sources)
+        for n, q in enumerate(request.questions, start=1)
+    ]
+    async with services.admission.ingest_slot():
+        return await services.evaluation.run(
+            str(project.tenant_id),
+            str(project.id),
+            questions,
+            top_k=min(request.top_k, settings.RAG_SEARCH_MAX_LIMIT) if request.top_k else None,
+            generate=request.generate,
+            use_cache=request.use_cache
+        )
+
+@router.get("/analytics/summary", response_model=schemas.AnalyticsSummary)
+async def analytics_summary(
+    days: int = 30,
+    project_id: Optional[uuid.UUID] = None,
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Chat usage per project over the last `days` (UTC), served from the rollup tables."""
+    if not current_user or current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can view analytics")
+    until = datetime.now(timezone.utc).date()
+    since = until - timedelta(days=max(days, 1) - 1)
+    projects = await services.analytics.summary(current_user.tenant_id, since, until, project_id)
+    return schemas.AnalyticsSummary(since=since, until=until, projects=projects)
+
+@router.get("/analytics/chat-logs")
+async def export_chat_logs(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    project_id: Optional[uuid.UUID] = None,
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    """Streams the tenant's chat logs; the export holds one cursor page in memory at a time."""
+    if not current_user or current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only Admins can export chat logs")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"chat_logs_{date.today():%Y%m%d}.{format}"
+    return StreamingResponse(
+        services.analytics.export_chat_logs(current_user.tenant_id, since, until, project_id, fmt=format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
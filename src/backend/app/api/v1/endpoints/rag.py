@@ -4,12 +4,12 @@ from sqlalchemy import select
 from app.db.session import get_db
 from app.db import models
 from app.schemas import rag as schemas
-from app.services.rag import rag_service
-from langchain_openai import ChatOpenAI
+from app.api.deps import get_services
+from app.services.container import ServiceContainer
 from app.core.config import settings
-from langchain_core.prompts import ChatPromptTemplate
+import time
 import uuid
-from typing import Optional
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -25,6 +25,18 @@ async def get_current_user_from_header(
         raise HTTPException(status_code=401, detail="Invalid User ID Header")
     return user
 
+async def admit_chat(
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
+):
+    """
+    Admission for interactive chat: per-tenant/per-user rate, then a slot in the
+    chat pool held for the lifetime of the request.
+    """
+    await services.admission.check_rate("chat", str(current_user.tenant_id), str(current_user.id))
+    async with services.admission.chat_slot():
+        yield
+
 async def verify_management_permission(user: models.User, project: models.Project):
     """
     Checks if user has management rights (delete/upload) for the project.
@@ -42,13 +54,41 @@ async def verify_management_permission(user: models.User, project: models.Projec
         
     raise HTTPException(status_code=403, detail="Only Admin or Manager can manage documents")
 
+async def verify_read_permission(user: models.User, project: models.Project):
+    """
+    Checks if user may query the project's knowledge base.
+    """
+    # Check 1: Tenant Isolation
+    if user.tenant_id != project.tenant_id:
+        raise HTTPException(status_code=403, detail="Cross-tenant access denied")
+
+    # Check 2: RBAC
+    if user.role == "admin":
+        return True
+
+    if user.role == "manager":
+        if user.department != project.department:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Manager access denied. User Dept: {user.department}, Project Dept: {project.department}"
+            )
+        return True
+
+    if user.department != project.department:
+        raise HTTPException(status_code=403, detail="Access denied. Department mismatch.")
+    return True
+
+def retrieval_filters(filters: Optional[schemas.RetrievalFilters]) -> Optional[dict]:
+    return filters.model_dump(exclude_none=True) if filters else None
+
 @router.post("/projects/{project_id}/documents", response_model=schemas.DocumentResponse)
 async def upload_document(
     project_id: uuid.UUID,
     doc: schemas.DocumentUpload,
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user_from_header)
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
 ):
     # 1. Verify Project
     project = await db.get(models.Project, project_id)
@@ -58,24 +98,33 @@ async def upload_document(
     # 2. Check Permission
     await verify_management_permission(current_user, project)
 
-    # 3. Save to PG
+    # 3. Admission: shed uploads before persisting anything we can't ingest soon
+    await services.admission.check_rate("ingest", str(project.tenant_id), str(current_user.id))
+    services.admission.check_ingest_backlog()
+
+    # 4. Save to PG
     db_doc = models.Document(
         project_id=project_id,
         title=doc.title,
-        content=doc.content
+        content=doc.content,
+        tags=doc.tags
     )
     db.add(db_doc)
     await db.commit()
     await db.refresh(db_doc)
 
-    # 4. Trigger Async Ingestion (RAG)
+    # 5. Trigger Async Ingestion (RAG), bounded by the ingest pool
     background_tasks.add_task(
-        rag_service.ingest_document,
+        services.admission.run_ingest,
+        services.rag.ingest_document,
         tenant_id=str(project.tenant_id),
         project_id=str(project_id),
         doc_id=str(db_doc.id),
         content=doc.content,
-        title=doc.title
+        title=doc.title,
+        tags=db_doc.tags,
+        created_at=db_doc.created_at,
+        updated_at=db_doc.updated_at
     )
 
     return db_doc
@@ -85,7 +134,8 @@ async def delete_document(
     project_id: uuid.UUID,
     doc_id: uuid.UUID,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user_from_header)
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services)
 ):
     # 1. Verify Project
     project = await db.get(models.Project, project_id)
@@ -107,20 +157,60 @@ async def delete_document(
     await db.delete(doc)
     await db.commit()
     
-    # 5. TODO: Delete from Vector DB (Qdrant)
-    # Note: Qdrant deletion by payload/filter is needed. 
-    # For now, we remove the Record. 
-    # To fully support this, we need a method in vector_service to delete vectors by doc_id.
-    from app.services.vector import vector_service
-    vector_service.delete_vectors_by_doc_id(str(project.tenant_id), str(project_id), str(doc_id))
+    # 5. Delete from Vector DB (Qdrant), including any re-index shadow collection.
+    # Postgres is already committed; if Qdrant fails the reconciler finishes the job.
+    try:
+        await services.rag.delete_document(str(project.tenant_id), str(project_id), str(doc_id))
+    except Exception:
+        await services.reconciler.record_failed_delete(str(project.tenant_id), str(project_id), str(doc_id))
 
     return {"status": "deleted", "id": str(doc_id)}
 
+@router.post("/search", response_model=schemas.SearchResponse)
+async def search(
+    request: schemas.SearchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services),
+    _admitted: None = Depends(admit_chat)
+):
+    """Retrieval only: the ranked chunks /chat would use as context, without generation."""
+    project = await db.get(models.Project, request.project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    await verify_read_permission(current_user, project)
+
+    results = await services.rag.retrieve(
+        tenant_id=str(project.tenant_id),
+        project_id=str(project.id),
+        query=request.query,
+        limit=min(request.limit or settings.RAG_TOP_K, settings.RAG_SEARCH_MAX_LIMIT),
+        filters=retrieval_filters(request.filters)
+    )
+    return schemas.SearchResponse(results=[schemas.SearchHit(**d) for d in results])
+
+async def get_conversation(
+    db: AsyncSession,
+    user: models.User,
+    project: models.Project,
+    conversation_id: Optional[uuid.UUID]
+) -> models.Conversation:
+    """The user's conversation in this project, or a new (unsaved) one."""
+    if conversation_id is None:
+        return models.Conversation(user_id=user.id, project_id=project.id, summary="", summary_turns=0, turns=0)
+    conversation = await db.get(models.Conversation, conversation_id)
+    if not conversation or conversation.user_id != user.id or conversation.project_id != project.id:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
 @router.post("/chat", response_model=schemas.ChatResponse)
 async def chat(
     request: schemas.ChatRequest, 
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user_from_header)
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services),
+    _admitted: None = Depends(admit_chat)
 ):
     # 1. Verify access & RBAC using header user
     # Note: request.user_id is redundant now, but we keep it or validate it matches.
@@ -131,79 +221,167 @@ async def chat(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
         
-    # Check 1: Tenant Isolation
-    if current_user.tenant_id != project.tenant_id:
-        raise HTTPException(status_code=403, detail="Cross-tenant access denied")
+    await verify_read_permission(current_user, project)
 
-    # Check 2: RBAC
-    if current_user.role == "admin":
-        pass 
-    elif current_user.role == "manager":
-        if current_user.department != project.department:
-            raise HTTPException(
-                status_code=403, 
-                detail=f"Manager access denied. User Dept: {current_user.department}, Project Dept: {project.department}"
-            )
-    else:
-        if current_user.department != project.department:
-             raise HTTPException(status_code=403, detail="Access denied. Department mismatch.")
+    # 2. Resolve the conversation; follow-ups are made standalone for retrieval
+    started = time.perf_counter()
+    conversation = await get_conversation(db, current_user, project, request.conversation_id)
+    history = services.conversation.history(conversation)
+    query = await services.conversation.standalone_question(conversation, request.question)
 
-    # 2. Retrieve Context
-    context_docs = await rag_service.retrieve(
+    # 3. Retrieve Context
+    stats = {}
+    context_docs = await services.rag.retrieve(
         tenant_id=str(project.tenant_id),
         project_id=str(project.id),
-        query=request.question,
-        limit=settings.RAG_TOP_K
+        query=query,
+        limit=settings.RAG_TOP_K,
+        filters=retrieval_filters(request.filters),
+        stats=stats
     )
 
-    # 3. Generate Answer
-    context_text = "\n\n".join([f"Source: {d['title']}\n{d['content']}" for d in context_docs])
-    
-    if not context_text:
+    # 4. Generate Answer
+    if not context_docs:
         return schemas.ChatResponse(
             answer="I don't have enough information in the provided documents to answer that question.",
-            sources=[]
+            sources=[],
+            conversation_id=request.conversation_id,
+            standalone_question=query if history else None
         )
 
-    llm = ChatOpenAI(model=settings.RAG_LLM_MODEL, api_key=settings.OPENAI_API_KEY)
-    
-    prompt = ChatPromptTemplate.from_template("""
-    You are an intelligent internal knowledge assistant.
-
-    INSTRUCTIONS:
-    1. Answer the user's question based EXCLUSIVELY on the provided context below.
-    2. The context contains up to {top_k} most relevant document chunks. Synthesize information from them to answer accurately.
-    3. Do not use outside knowledge or make up information.
-    4. If the answer cannot be found in the context, state clearly that you do not know.
-    5. You MUST cite the source of your information for every claim, using the format [Source Title].
-
-    CONTEXT:
-    {context}
-
-    USER QUESTION:
-    {question}
-    """)
-    
-    chain = prompt | llm
-    
-    response = await chain.ainvoke({
-        "context": context_text,
-        "question": request.question,
-        "top_k": settings.RAG_TOP_K
-    })
+    response = await services.rag.generate_answer(request.question, context_docs, history=history)
 
-    # 4. Save Chat Log
+    # 5. Save Chat Log and advance the conversation
+    turn = await services.conversation.record_turn(db, conversation, request.question, response.content)
     chat_log = models.ChatLog(
         user_id=current_user.id,
         project_id=request.project_id,
+        conversation_id=conversation.id,
         question=request.question,
+        standalone_question=query if history else None,
         answer=response.content,
-        sources=[{"title": d["title"]} for d in context_docs]
+        sources=[{"title": d["title"]} for d in context_docs],
+        cache_hit=stats.get("cache_hit"),
+        latency_ms=int((time.perf_counter() - started) * 1000)
     )
     db.add(chat_log)
     await db.commit()
 
+    # 6. Fold earlier turns into the summary after responding
+    if turn > 1:
+        background_tasks.add_task(services.conversation.fold, conversation.id)
+
     return schemas.ChatResponse(
         answer=response.content,
-        sources=[schemas.Source(title=d['title'], content=d['content'][:200] + "...") for d in context_docs]
+        sources=[schemas.Source(title=d['title'], content=d['content'][:200] + "...") for d in context_docs],
+        conversation_id=conversation.id,
+        standalone_question=query if history else None
+    )
+
+async def accessible_projects(
+    db: AsyncSession,
+    user: models.User,
+    project_ids: Optional[List[uuid.UUID]] = None
+) -> List[models.Project]:
+    """
+    Projects the user may read, in one query (same rules as verify_read_permission):
+    admins see the whole tenant, everyone else their department's projects.
+    """
+    query = select(models.Project).where(models.Project.tenant_id == user.tenant_id)
+    if user.role != "admin":
+        query = query.where(models.Project.department == user.department)
+    if project_ids:
+        query = query.where(models.Project.id.in_(project_ids))
+    projects = (await db.execute(query.order_by(models.Project.created_at))).scalars().all()
+    if project_ids and len(projects) != len(set(project_ids)):
+        raise HTTPException(status_code=403, detail="Access denied to one or more requested projects")
+    if len(projects) > settings.FEDERATED_MAX_PROJECTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many projects ({len(projects)}); narrow the search with project_ids (max {settings.FEDERATED_MAX_PROJECTS})"
+        )
+    return projects
+
+@router.post("/search/federated", response_model=schemas.FederatedSearchResponse)
+async def federated_search(
+    request: schemas.FederatedSearchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services),
+    _admitted: None = Depends(admit_chat)
+):
+    """Searches every accessible project (or the given subset) and merges the hits into one ranking."""
+    projects = await accessible_projects(db, current_user, request.project_ids)
+    names = {str(p.id): p.name for p in projects}
+
+    result = await services.federated.search(
+        tenant_id=str(current_user.tenant_id),
+        project_ids=list(names),
+        query=request.query,
+        limit=min(request.limit or settings.RAG_TOP_K, settings.RAG_SEARCH_MAX_LIMIT),
+        filters=retrieval_filters(request.filters)
+    )
+    return schemas.FederatedSearchResponse(
+        results=[schemas.FederatedHit(project_name=names[d["project_id"]], **d) for d in result.results],
+        projects_searched=result.projects_searched,
+        timed_out=result.timed_out,
+        failed=result.failed
+    )
+
+@router.post("/chat/federated", response_model=schemas.FederatedChatResponse)
+async def federated_chat(
+    request: schemas.FederatedChatRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user_from_header),
+    services: ServiceContainer = Depends(get_services),
+    _admitted: None = Depends(admit_chat)
+):
+    if request.user_id != current_user.id:
+         raise HTTPException(status_code=400, detail="User ID mismatch between header and body")
+
+    # 1. Resolve accessible projects (one RBAC query)
+    projects = await accessible_projects(db, current_user, request.project_ids)
+    names = {str(p.id): p.name for p in projects}
+
+    # 2. Retrieve Context across projects
+    started = time.perf_counter()
+    result = await services.federated.search(
+        tenant_id=str(current_user.tenant_id),
+        project_ids=list(names),
+        query=request.question,
+        limit=settings.RAG_TOP_K,
+        filters=retrieval_filters(request.filters)
+    )
+    context_docs = result.results
+
+    # 3. Generate Answer
+    if not context_docs:
+        return schemas.FederatedChatResponse(
+            answer="I don't have enough information in the provided documents to answer that question.",
+            sources=[],
+            projects_searched=result.projects_searched,
+            timed_out=result.timed_out,
+            failed=result.failed
+        )
+
+    response = await services.rag.generate_answer(request.question, context_docs)
+
+    # 4. Save Chat Log (not tied to a single project; sources carry the project)
+    chat_log = models.ChatLog(
+        user_id=current_user.id,
+        project_id=None,
+        question=request.question,
+        answer=response.content,
+        sources=[{"title": d["title"], "project_id": d["project_id"]} for d in context_docs],
+        latency_ms=int((time.perf_counter() - started) * 1000)
+    )
+    db.add(chat_log)
+    await db.commit()
+
+    return schemas.FederatedChatResponse(
+        answer=response.content,
+        sources=[schemas.Source(title=d['title'], content=d['content'][:200] + "...") for d in context_docs],
+        projects_searched=result.projects_searched,
+        timed_out=result.timed_out,
+        failed=result.failed
     )
@@ -21,6 +21,78 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     RAG_TOP_K: int = 3
+    RAG_SEARCH_MAX_LIMIT: int = 50
+
+    # Cross-project (federated) search
+    FEDERATED_MAX_CONCURRENCY: int = 16
+    FEDERATED_SHARD_TIMEOUT: float = 2.0
+    FEDERATED_MAX_PROJECTS: int = 100
+
+    # Cache warming from chat history
+    WARM_CACHE_ON_STARTUP: bool = True
+    WARM_INTERVAL_SECONDS: int = 600  # 0 disables the background warmer
+    WARM_LOOKBACK_DAYS: int = 7
+    WARM_TOP_QUESTIONS: int = 50
+    WARM_MIN_COUNT: int = 2
+    WARM_TENANT_DAILY_TOKENS: int = 50000
+    WARM_SEARCH_CONCURRENCY: int = 4
+
+    # Multi-turn chat
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+    CONVERSATION_REWRITE_MAX_TOKENS: int = 100
+    CONVERSATION_TURN_MAX_CHARS: int = 2000  # latest answer is clipped to this in prompts
+
+    # Reporting
+    ANALYTICS_DATABASE_URL: Optional[str] = None  # read replica for dashboards/exports
+    ANALYTICS_ROLLUP_INTERVAL_SECONDS: int = 60  # 0 disables the background rollup
+    ANALYTICS_ROLLUP_LAG_SECONDS: int = 120
+    ANALYTICS_ROLLUP_WINDOW_HOURS: int = 24
+    ANALYTICS_TOP_DOCUMENTS: int = 10
+    ANALYTICS_EXPORT_PAGE_SIZE: int = 1000
+
+    # Batch evaluation runner
+    EVAL_SEARCH_CONCURRENCY: int = 8
+    EVAL_ANSWER_CONCURRENCY: int = 4
+    EVAL_MAX_QUESTIONS: int = 500
+
+    # Chunk dedup: exact matches share a point at ingest, near-duplicates (MinHash) collapse at retrieval
+    DEDUP_ENABLED: bool = True
+    DEDUP_THRESHOLD: float = 0.9  # MinHash similarity at which retrieved chunks are collapsed
+    DEDUP_NUM_PERM: int = 64
+    DEDUP_SHINGLE_SIZE: int = 3
+    DEDUP_SEARCH_OVERFETCH: int = 2
+
+    # Embedding index registry / re-embedding
+    INDEX_REGISTRY_TTL: float = 5.0
+    REINDEX_BATCH_SIZE: int = 256
+    REINDEX_BATCH_DELAY: float = 0.5
+    REINDEX_LOCK_TTL: int = 120
+
+    # Postgres <-> Qdrant reconciler (interval 0 disables the schedule)
+    RECONCILE_INTERVAL_SECONDS: int = 900
+    RECONCILE_FULL_EVERY: int = 24
+    RECONCILE_PAGE_SIZE: int = 1000
+    RECONCILE_GRACE_SECONDS: int = 300
+    RECONCILE_MAX_REQUEUE: int = 500
+    RECONCILE_LOCK_TTL: int = 3600  # Refreshed per project; bounds a crashed run's lock
+
+    # Startup (pools, registry, tokenizer); False defers it to the first /ready probe
+    WARMUP_ON_STARTUP: bool = True
+
+    # Admission Control (token buckets are per second; concurrency is per worker)
+    RATE_LIMIT_ENABLED: bool = True
+    CHAT_TENANT_RATE: float = 10.0
+    CHAT_TENANT_BURST: int = 30
+    CHAT_USER_RATE: float = 1.0
+    CHAT_USER_BURST: int = 5
+    CHAT_MAX_CONCURRENCY: int = 32
+    CHAT_QUEUE_TIMEOUT: float = 0.5
+    INGEST_TENANT_RATE: float = 1.0
+    INGEST_TENANT_BURST: int = 20
+    INGEST_USER_RATE: float = 0.5
+    INGEST_USER_BURST: int = 10
+    INGEST_MAX_CONCURRENCY: int = 4
+    INGEST_MAX_PENDING: int = 100
 
     class Config:
         env_file = ".env"
@@ -1,6 +1,6 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey, DateTime, Text, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, ForeignKey, DateTime, Date, Text, JSON, Integer, SmallInteger, BigInteger, Boolean
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -49,18 +49,94 @@ class Document(Base):
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     file_path = Column(String)
+    tags = Column(ARRAY(String), nullable=False, server_default="{}")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     project = relationship("Project", back_populates="documents")
 
+class ProjectIndex(Base):
+    """Which Qdrant collection and embedding model serve a project, plus any in-flight re-index."""
+    __tablename__ = "project_indexes"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    collection_name = Column(String, nullable=False)
+    embedding_model = Column(String, nullable=False)
+    embedding_dim = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    shadow_collection_name = Column(String)
+    shadow_embedding_model = Column(String)
+    shadow_embedding_dim = Column(Integer)
+    retired_collection_name = Column(String)
+    reindex_status = Column(String)  # 'running', 'completed', 'failed'
+    reindex_cursor = Column(String)
+    reindex_done = Column(Integer, nullable=False, default=0)
+    reindex_total = Column(Integer, nullable=False, default=0)
+    reindex_error = Column(Text)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Conversation(Base):
+    """Older turns are folded into `summary`; the latest turn is kept verbatim."""
+    __tablename__ = "conversations"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"))
+    summary = Column(Text, nullable=False, default="")
+    summary_turns = Column(Integer, nullable=False, default=0)
+    turns = Column(Integer, nullable=False, default=0)
+    last_question = Column(Text)
+    last_answer = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class ChatLog(Base):
     __tablename__ = "chat_logs"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id"))
+    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"))
     question = Column(Text, nullable=False)
+    standalone_question = Column(Text)  # follow-ups only: the question retrieval actually used
     answer = Column(Text, nullable=False)
     sources = Column(JSON)
+    cache_hit = Column(Boolean)
+    latency_ms = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Reporting rollups, maintained incrementally from chat_logs by AnalyticsService.
+
+class ChatStatsDaily(Base):
+    __tablename__ = "chat_stats_daily"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    questions = Column(Integer, nullable=False, default=0)
+    cache_lookups = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    latency_count = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(BigInteger, nullable=False, default=0)
+
+class ChatLatencyDaily(Base):
+    """Latency histogram; bucket b covers up to 2 ** ((b + 1) / 4) ms."""
+    __tablename__ = "chat_latency_daily"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    bucket = Column(SmallInteger, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ChatCitationsDaily(Base):
+    __tablename__ = "chat_citations_daily"
+
+    project_id = Column(UUID(as_uuid=True), ForeignKey("projects.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    title = Column(Text, primary_key=True)
+    citations = Column(Integer, nullable=False, default=0)
+
+class AnalyticsWatermark(Base):
+    __tablename__ = "analytics_watermarks"
+
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
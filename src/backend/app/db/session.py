@@ -8,6 +8,15 @@ AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Reporting reads (dashboards, exports) go to a replica when one is configured.
+analytics_engine = (
+    create_async_engine(settings.ANALYTICS_DATABASE_URL) if settings.ANALYTICS_DATABASE_URL else engine
+)
+
+AnalyticsSessionLocal = sessionmaker(
+    analytics_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
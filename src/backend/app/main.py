@@ -1,11 +1,34 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.core.config import settings
+from app.services.container import ServiceContainer
+from app.services.admission import AdmissionRejected
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = ServiceContainer()
+    app.state.services = services
+    # Warm up in the background so the process starts accepting (and answering /health)
+    # immediately; /ready flips once pools are open.
+    services.spawn(services.start())
+    yield
+    await services.close()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -24,5 +47,19 @@ async def root():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness_check():
+    services: ServiceContainer = app.state.services
+    if not services.ready and not services.warming:
+        # Not warmed up yet (or a dependency was down): retry in the background so the
+        # probe answers with the current checks instead of waiting on a dead dependency.
+        services.spawn(services.warm_up())
+    body = {
+        "status": "ready" if services.ready else "starting",
+        "checks": services.checks,
+        "warmup_seconds": services.warmup_seconds,
+    }
+    return JSONResponse(status_code=200 if services.ready else 503, content=body)
+
 from app.api.v1.api import api_router
 app.include_router(api_router, prefix=settings.API_V1_STR)
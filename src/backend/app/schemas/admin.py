@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 import uuid
-from typing import Optional
+from datetime import date
+from typing import Any, Dict, List, Optional
 
 class TenantCreate(BaseModel):
     name: str
@@ -26,3 +27,88 @@ class UserCreate(BaseModel):
 
 class UserResponse(UserCreate):
     id: uuid.UUID
+
+class ReindexRequest(BaseModel):
+    embedding_model: str
+
+class ReindexStatus(BaseModel):
+    project_id: uuid.UUID
+    collection_name: str
+    embedding_model: str
+    version: int
+    status: Optional[str] = None
+    target_model: Optional[str] = None
+    done: int = 0
+    total: int = 0
+    error: Optional[str] = None
+
+class ReconcileReport(BaseModel):
+    mode: str
+    tenant_id: Optional[str] = None
+    started_at: str
+    finished_at: str
+    projects_checked: int
+    documents_checked: int
+    documents_requeued: int
+    orphan_documents_purged: int
+    orphan_collections_deleted: List[str]
+    retired_collections_dropped: List[str]
+    errors: List[str]
+
+class ReconcileStarted(BaseModel):
+    status: str
+    mode: str
+    tenant_id: str
+
+class WarmReport(BaseModel):
+    projects: int
+    questions_warmed: int
+    already_cached: int
+    over_budget: int
+    embedding_tokens: int
+    errors: List[str]
+    failed_projects: List[str] = []
+
+class EvalQuestion(BaseModel):
+    id: Optional[str] = None
+    question: str
+    expected_sources: List[str] = []
+
+class EvaluationRequest(BaseModel):
+    questions: List[EvalQuestion]
+    top_k: Optional[int] = None
+    generate: bool = False
+    use_cache: bool = False
+
+class EvaluationResponse(BaseModel):
+    summary: Dict[str, Any]
+    results: List[Dict[str, Any]]
+
+class DailyChatStats(BaseModel):
+    day: date
+    questions: int
+    cache_hit_ratio: Optional[float] = None
+    latency_avg_ms: Optional[float] = None
+    latency_p50_ms: Optional[float] = None
+    latency_p95_ms: Optional[float] = None
+
+class CitedDocument(BaseModel):
+    title: str
+    citations: int
+
+class ProjectChatStats(BaseModel):
+    project_id: uuid.UUID
+    project_name: str
+    questions: int
+    cache_hit_ratio: Optional[float] = None
+    latency_avg_ms: Optional[float] = None
+    latency_p50_ms: Optional[float] = None
+    latency_p95_ms: Optional[float] = None
+    latency_p99_ms: Optional[float] = None
+    top_documents: List[CitedDocument]
+    daily: List[DailyChatStats]
+
+class AnalyticsSummary(BaseModel):
+    since: date
+    until: date
+    projects: List[ProjectChatStats]
@@ -1,19 +1,38 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
+from datetime import datetime
 import uuid
 
 class DocumentUpload(BaseModel):
     title: str
     content: str
+    tags: List[str] = []
 
 class DocumentResponse(DocumentUpload):
     id: uuid.UUID
     project_id: uuid.UUID
 
+class RetrievalFilters(BaseModel):
+    doc_ids: Optional[List[uuid.UUID]] = None
+    title_prefix: Optional[str] = None
+    tags: Optional[List[str]] = None  # matches documents carrying any of them
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+
 class ChatRequest(BaseModel):
     user_id: uuid.UUID
     project_id: uuid.UUID
     question: str
+    filters: Optional[RetrievalFilters] = None
+    conversation_id: Optional[uuid.UUID] = None  # omit to start a new conversation
+
+class SearchRequest(BaseModel):
+    project_id: uuid.UUID
+    query: str
+    limit: Optional[int] = Field(None, ge=1)
+    filters: Optional[RetrievalFilters] = None
 
 class Source(BaseModel):
     title: str
@@ -22,3 +41,40 @@ class Source(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Source]
+    conversation_id: Optional[uuid.UUID] = None
+    standalone_question: Optional[str] = None  # follow-up as rewritten for retrieval
+
+class SearchHit(BaseModel):
+    title: str
+    content: str
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+
+class FederatedSearchRequest(BaseModel):
+    query: str
+    project_ids: Optional[List[uuid.UUID]] = None  # default: every project the caller can read
+    limit: Optional[int] = Field(None, ge=1)
+    filters: Optional[RetrievalFilters] = None
+
+class FederatedHit(SearchHit):
+    project_id: uuid.UUID
+    project_name: str
+
+class FederatedSearchResponse(BaseModel):
+    results: List[FederatedHit]
+    projects_searched: int
+    timed_out: List[uuid.UUID] = []
+    failed: List[uuid.UUID] = []
+
+class FederatedChatRequest(BaseModel):
+    user_id: uuid.UUID
+    question: str
+    project_ids: Optional[List[uuid.UUID]] = None
+    filters: Optional[RetrievalFilters] = None
+
+class FederatedChatResponse(ChatResponse):
+    projects_searched: int
+    timed_out: List[uuid.UUID] = []
+    failed: List[uuid.UUID] = []
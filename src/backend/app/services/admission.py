@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import math
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from app.core.config import settings
+from app.services.cache import CacheService
+
+logger = logging.getLogger(__name__)
+
+# Refills every bucket in KEYS, then takes `cost` tokens from all of them or from none.
+# ARGV = [cost, rate_1, burst_1, rate_2, burst_2, ...]. Returns {allowed, retry_after_ms}.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i])
+  local burst = tonumber(ARGV[2 * i + 1])
+  local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(bucket[1]) or burst
+  local ts = tonumber(bucket[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  if tokens < cost then
+    wait = math.max(wait, (cost - tokens) / rate)
+  end
+  levels[i] = tokens
+end
+local allowed = 0
+if wait == 0 then allowed = 1 end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i])
+  local burst = tonumber(ARGV[2 * i + 1])
+  local tokens = levels[i]
+  if allowed == 1 then tokens = tokens - cost end
+  redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+  redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {allowed, math.ceil(wait * 1000)}
+"""
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; mapped to 429 + Retry-After by the app."""
+    def __init__(self, detail: str, retry_after: float = 1.0):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+@dataclass
+class WorkloadLimits:
+    tenant_rate: float
+    tenant_burst: int
+    user_rate: float
+    user_burst: int
+    max_concurrency: int
+
+class WorkloadPool:
+    """Per-process concurrency limit for one class of work."""
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def saturated(self) -> bool:
+        return self.in_flight >= self.limit
+
+    @asynccontextmanager
+    async def slot(self, timeout: float = None):
+        self.waiting += 1
+        try:
+            if timeout is None:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected(f"Server busy ({self.name}), please retry", retry_after=1)
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+class AdmissionService:
+    """
+    Admission control for interactive chat and background ingestion.
+
+    Rate: Redis token buckets per tenant and per user, shared by all workers.
+    Concurrency: separate per-process pools so a burst of ingestion can never
+    occupy the slots (event loop, DB pool, OpenAI quota) that chat needs.
+    """
+    def __init__(self, cache: CacheService):
+        self.cache = cache
+        self.enabled = settings.RATE_LIMIT_ENABLED
+        self.limits = {
+            "chat": WorkloadLimits(
+                tenant_rate=settings.CHAT_TENANT_RATE,
+                tenant_burst=settings.CHAT_TENANT_BURST,
+                user_rate=settings.CHAT_USER_RATE,
+                user_burst=settings.CHAT_USER_BURST,
+                max_concurrency=settings.CHAT_MAX_CONCURRENCY,
+            ),
+            "ingest": WorkloadLimits(
+                tenant_rate=settings.INGEST_TENANT_RATE,
+                tenant_burst=settings.INGEST_TENANT_BURST,
+                user_rate=settings.INGEST_USER_RATE,
+                user_burst=settings.INGEST_USER_BURST,
+                max_concurrency=settings.INGEST_MAX_CONCURRENCY,
+            ),
+        }
+        self.pools = {name: WorkloadPool(name, l.max_concurrency) for name, l in self.limits.items()}
+        self._script = None
+
+    async def check_rate(self, workload: str, tenant_id: str, user_id: str, cost: int = 1):
+        """Consumes tokens from the tenant and user buckets or raises AdmissionRejected."""
+        if not self.enabled:
+            return
+        limits = self.limits[workload]
+        if self._script is None:
+            self._script = self.cache.redis.register_script(TOKEN_BUCKET_LUA)
+        try:
+            allowed, retry_ms = await self._script(
+                keys=[
+                    f"ratelimit:{workload}:tenant:{tenant_id}",
+                    f"ratelimit:{workload}:user:{user_id}",
+                ],
+                args=[cost, limits.tenant_rate, limits.tenant_burst, limits.user_rate, limits.user_burst],
+            )
+        except Exception as e:
+            # Fail open: losing Redis must not take chat down with it.
+            logger.warning("Rate limiter unavailable, admitting request: %s", e)
+            return
+        if not int(allowed):
+            raise AdmissionRejected(f"Rate limit exceeded for {workload}", retry_after=int(retry_ms) / 1000)
+
+    def chat_slot(self):
+        """Interactive work fails fast when the pool is full instead of queueing."""
+        return self.pools["chat"].slot(timeout=settings.CHAT_QUEUE_TIMEOUT)
+
+    def check_ingest_backlog(self):
+        pool = self.pools["ingest"]
+        if pool.in_flight + pool.waiting >= settings.INGEST_MAX_PENDING:
+            raise AdmissionRejected("Ingestion backlog is full, please retry later", retry_after=30)
+
+    @asynccontextmanager
+    async def ingest_slot(self):
+        """
+        Background work queues for its own pool, then yields to chat while the
+        chat pool is saturated so ingestion never competes with interactive latency.
+        """
+        async with self.pools["ingest"].slot():
+            delay = 0.05
+            while self.pools["chat"].saturated:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            yield
+
+    async def run_ingest(self, func, *args, **kwargs):
+        """Runs an ingestion coroutine function inside an ingest slot (used from BackgroundTasks)."""
+        async with self.ingest_slot():
+            return await func(*args, **kwargs)
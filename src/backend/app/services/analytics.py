@@ -0,0 +1,289 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import math
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional
+from sqlalchemy import func, or_, select, text
+from app.core.config import settings
+from app.db import models
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_WATERMARK = "chat_rollups"
+EXPORT_FIELDS = [
+    "id", "created_at", "user_id", "project_id", "conversation_id",
+    "question", "standalone_question", "answer", "sources", "cache_hit", "latency_ms",
+]
+
+# Four buckets per doubling: bucket b holds latencies up to 2 ** ((b + 1) / 4) ms (~19% wide).
+LATENCY_BUCKETS_PER_DOUBLING = 4
+
+# Each statement aggregates chat_logs rows in (:start, :end] and adds them to the rollups.
+_ROLLUP_STATEMENTS = [
+    text("""
+        INSERT INTO chat_stats_daily
+            (project_id, day, questions, cache_lookups, cache_hits, latency_count, latency_ms_sum)
+        SELECT project_id, (created_at AT TIME ZONE 'UTC')::date,
+               count(*), count(cache_hit), count(*) FILTER (WHERE cache_hit),
+               count(latency_ms), coalesce(sum(latency_ms), 0)
+        FROM chat_logs
+        WHERE created_at > :start AND created_at <= :end AND project_id IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (project_id, day) DO UPDATE SET
+            questions = chat_stats_daily.questions + EXCLUDED.questions,
+            cache_lookups = chat_stats_daily.cache_lookups + EXCLUDED.cache_lookups,
+            cache_hits = chat_stats_daily.cache_hits + EXCLUDED.cache_hits,
+            latency_count = chat_stats_daily.latency_count + EXCLUDED.latency_count,
+            latency_ms_sum = chat_stats_daily.latency_ms_sum + EXCLUDED.latency_ms_sum
+    """),
+    text(f"""
+        INSERT INTO chat_latency_daily (project_id, day, bucket, count)
+        SELECT project_id, (created_at AT TIME ZONE 'UTC')::date,
+               floor({LATENCY_BUCKETS_PER_DOUBLING} * log(2.0, greatest(latency_ms, 1)::numeric))::smallint,
+               count(*)
+        FROM chat_logs
+        WHERE created_at > :start AND created_at <= :end AND project_id IS NOT NULL AND latency_ms IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (project_id, day, bucket) DO UPDATE SET
+            count = chat_latency_daily.count + EXCLUDED.count
+    """),
+    # Federated answers have no project_id of their own; their sources carry it.
+    text("""
+        INSERT INTO chat_citations_daily (project_id, day, title, citations)
+        SELECT p.id, (l.created_at AT TIME ZONE 'UTC')::date, src->>'title', count(DISTINCT l.id)
+        FROM chat_logs l
+        CROSS JOIN LATERAL jsonb_array_elements(coalesce(l.sources::jsonb, '[]'::jsonb)) AS src
+        JOIN projects p ON p.id = coalesce((src->>'project_id')::uuid, l.project_id)
+        WHERE l.created_at > :start AND l.created_at <= :end AND src->>'title' IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (project_id, day, title) DO UPDATE SET
+            citations = chat_citations_daily.citations + EXCLUDED.citations
+    """),
+]
+
+def latency_percentile(histogram: Dict[int, int], pct: float) -> Optional[float]:
+    """Upper bound (ms) of the histogram bucket holding the pct-th percentile."""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = math.ceil(pct / 100 * total)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return round(2 ** ((bucket + 1) / LATENCY_BUCKETS_PER_DOUBLING), 1)
+
+def _ratio(part: int, whole: int) -> Optional[float]:
+    return round(part / whole, 4) if whole else None
+
+class AnalyticsService:
+    """
+    Chat usage reporting.
+
+    chat_logs is aggregated into daily rollup tables (questions, cache hit ratio, a
+    latency histogram and cited documents per project) by a background job that only
+    reads rows past a watermark, one bounded time window per transaction. The window
+    stops ANALYTICS_ROLLUP_LAG_SECONDS short of now so chat transactions still in
+    flight are not skipped. Dashboards read the rollups and exports stream chat_logs
+    with a server-side cursor; both go through ANALYTICS_DATABASE_URL when a read
+    replica is configured.
+    """
+    def __init__(self, session_factory=None, read_session_factory=None):
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    @property
+    def read_session_factory(self):
+        if self._read_session_factory is None:
+            from app.db.session import AnalyticsSessionLocal
+            self._read_session_factory = AnalyticsSessionLocal
+        return self._read_session_factory
+
+    async def rollup(self) -> int:
+        """Folds new chat_logs rows into the rollups. Returns the number of windows processed."""
+        windows = 0
+        while await self._rollup_window():
+            windows += 1
+        return windows
+
+    async def _rollup_window(self) -> bool:
+        async with self.session_factory() as db:
+            # 1. Lock the watermark so concurrent workers take turns
+            await db.execute(
+                text("""
+                    INSERT INTO analytics_watermarks (name, watermark)
+                    SELECT :name, coalesce(min(created_at), now()) - interval '1 microsecond' FROM chat_logs
+                    ON CONFLICT (name) DO NOTHING
+                """),
+                {"name": ROLLUP_WATERMARK}
+            )
+            start = (await db.execute(
+                text("SELECT watermark FROM analytics_watermarks WHERE name = :name FOR UPDATE"),
+                {"name": ROLLUP_WATERMARK}
+            )).scalar_one()
+
+            # 2. Pick the next window
+            horizon = datetime.now(timezone.utc) - timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS)
+            end = min(horizon, start + timedelta(hours=settings.ANALYTICS_ROLLUP_WINDOW_HOURS))
+            if end <= start:
+                await db.commit()
+                return False
+
+            # 3. Aggregate it and advance the watermark in the same transaction
+            for statement in _ROLLUP_STATEMENTS:
+                await db.execute(statement, {"start": start, "end": end})
+            await db.execute(
+                text("UPDATE analytics_watermarks SET watermark = :end WHERE name = :name"),
+                {"end": end, "name": ROLLUP_WATERMARK}
+            )
+            await db.commit()
+        return end < horizon
+
+    async def run_forever(self):
+        while True:
+            try:
+                windows = await self.rollup()
+                if windows:
+                    logger.info("Analytics rollup processed %d window(s)", windows)
+            except Exception:
+                logger.exception("Analytics rollup failed")
+            await asyncio.sleep(settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS)
+
+    async def summary(
+        self,
+        tenant_id: uuid.UUID,
+        since: date,
+        until: date,
+        project_id: Optional[uuid.UUID] = None
+    ) -> List[Dict]:
+        """Per-project totals, daily series and top cited documents, from the rollups only."""
+        def scoped(query, table):
+            query = (
+                query.join(models.Project, models.Project.id == table.project_id)
+                .where(models.Project.tenant_id == tenant_id, table.day >= since, table.day <= until)
+            )
+            return query.where(table.project_id == project_id) if project_id else query
+
+        stats_t, latency_t, cites_t = models.ChatStatsDaily, models.ChatLatencyDaily, models.ChatCitationsDaily
+        citations = func.sum(cites_t.citations).label("citations")
+        async with self.read_session_factory() as db:
+            stats = (await db.execute(
+                scoped(select(stats_t, models.Project.name), stats_t).order_by(stats_t.project_id, stats_t.day)
+            )).all()
+            latencies = (await db.execute(
+                scoped(select(latency_t.project_id, latency_t.day, latency_t.bucket, latency_t.count), latency_t)
+            )).all()
+            cited = (await db.execute(
+                scoped(select(cites_t.project_id, cites_t.title, citations), cites_t)
+                .group_by(cites_t.project_id, cites_t.title)
+                .order_by(cites_t.project_id, citations.desc(), cites_t.title)
+            )).all()
+
+        daily_histograms: Dict[tuple, Dict[int, int]] = {}
+        for row in latencies:
+            histogram = daily_histograms.setdefault((row.project_id, row.day), {})
+            histogram[row.bucket] = histogram.get(row.bucket, 0) + row.count
+
+        projects: Dict[uuid.UUID, Dict] = {}
+        for row, name in stats:
+            entry = projects.setdefault(row.project_id, {
+                "project_id": row.project_id,
+                "project_name": name,
+                "totals": {"questions": 0, "cache_lookups": 0, "cache_hits": 0, "latency_count": 0, "latency_ms_sum": 0},
+                "histogram": {},
+                "daily": [],
+                "top_documents": [],
+            })
+            for key in entry["totals"]:
+                entry["totals"][key] += getattr(row, key)
+            histogram = daily_histograms.get((row.project_id, row.day), {})
+            for bucket, count in histogram.items():
+                entry["histogram"][bucket] = entry["histogram"].get(bucket, 0) + count
+            entry["daily"].append({
+                "day": row.day,
+                "questions": row.questions,
+                "cache_hit_ratio": _ratio(row.cache_hits, row.cache_lookups),
+                "latency_avg_ms": _ratio(row.latency_ms_sum, row.latency_count),
+                "latency_p50_ms": latency_percentile(histogram, 50),
+                "latency_p95_ms": latency_percentile(histogram, 95),
+            })
+        for row in cited:
+            entry = projects.get(row.project_id)
+            if entry and len(entry["top_documents"]) < settings.ANALYTICS_TOP_DOCUMENTS:
+                entry["top_documents"].append({"title": row.title, "citations": row.citations})
+
+        results = []
+        for entry in projects.values():
+            totals, histogram = entry.pop("totals"), entry.pop("histogram")
+            results.append(dict(
+                entry,
+                questions=totals["questions"],
+                cache_hit_ratio=_ratio(totals["cache_hits"], totals["cache_lookups"]),
+                latency_avg_ms=_ratio(totals["latency_ms_sum"], totals["latency_count"]),
+                latency_p50_ms=latency_percentile(histogram, 50),
+                latency_p95_ms=latency_percentile(histogram, 95),
+                latency_p99_ms=latency_percentile(histogram, 99),
+            ))
+        return results
+
+    async def export_chat_logs(
+        self,
+        tenant_id: uuid.UUID,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        project_id: Optional[uuid.UUID] = None,
+        fmt: str = "ndjson"
+    ) -> AsyncIterator[str]:
+        """
+        Yields the tenant's chat logs as CSV or NDJSON, one chunk per cursor page.
+        Federated logs (no project) belong to the tenant of the user who asked.
+        """
+        logs = models.ChatLog
+        query = (
+            select(*(getattr(logs, name) for name in EXPORT_FIELDS))
+            .outerjoin(models.Project, models.Project.id == logs.project_id)
+            .outerjoin(models.User, models.User.id == logs.user_id)
+            .where(or_(models.Project.tenant_id == tenant_id, models.User.tenant_id == tenant_id))
+            .order_by(logs.created_at, logs.id)
+        )
+        if since:
+            query = query.where(logs.created_at >= since)
+        if until:
+            query = query.where(logs.created_at < until)
+        if project_id:
+            query = query.where(logs.project_id == project_id)
+
+        page_size = settings.ANALYTICS_EXPORT_PAGE_SIZE
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            yield buffer.getvalue()
+
+        async with self.read_session_factory() as db:
+            result = await db.stream(query.execution_options(yield_per=page_size))
+            async for rows in result.partitions(page_size):
+                if fmt == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    for row in rows:
+                        writer.writerow([
+                            json.dumps(value) if name == "sources" else value
+                            for name, value in zip(EXPORT_FIELDS, row)
+                        ])
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + "\n" for row in rows
+                    )
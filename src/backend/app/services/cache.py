@@ -1,19 +1,53 @@
-import redis.asyncio as redis
 import json
+from typing import List, Optional
 from app.core.config import settings
 
 class CacheService:
-    def __init__(self):
-        self.redis = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    def __init__(self, url: Optional[str] = None, client=None):
+        self.url = url or settings.REDIS_URL
+        self._redis = client
         self.ttl = 3600  # 1 hour cache
 
+    @property
+    def redis(self):
+        # Built lazily so the connection pool belongs to the process that uses it.
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url, encoding="utf-8", decode_responses=True)
+        return self._redis
+
+    async def ping(self) -> bool:
+        return await self.redis.ping()
+
     async def get_cache(self, key: str):
         return await self.redis.get(key)
 
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.redis.mget(keys)
+
     async def set_cache(self, key: str, value: str):
         await self.redis.set(key, value, ex=self.ttl)
 
-    def generate_key(self, tenant_id: str, project_id: str, query: str) -> str:
-        return f"rag:{tenant_id}:{project_id}:{query}"
+    def generate_key(
+        self,
+        tenant_id: str,
+        project_id: str,
+        query: str,
+        version: int = 1,
+        scope: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> str:
+        # The index version changes on re-embedding cut-over, retiring old entries.
+        prefix = f"rag:{tenant_id}:{project_id}:v{version}"
+        if limit:
+            # Result lists of different lengths (chat vs. search) are cached apart.
+            prefix += f":k{limit}"
+        if scope:
+            # Filtered retrievals are cached apart from the unfiltered ones.
+            return f"{prefix}:f{scope}:{query}"
+        return f"{prefix}:{query}"
 
-cache_service = CacheService()
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set
+from app.services.cache import CacheService
+from app.services.vector import VectorService
+from app.services.index import IndexRegistry
+from app.services.dedup import DedupService
+from app.services.rag import RagService
+from app.services.federated import FederatedSearchService
+from app.services.conversation import ConversationService
+from app.services.evaluation import EvaluationService
+from app.services.warmer import CacheWarmerService
+from app.services.analytics import AnalyticsService
+from app.services.admission import AdmissionService
+from app.services.reindex import ReindexService
+from app.services.reconciler import ReconcilerService
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """
+    Owns the process-wide service instances. Built in the FastAPI lifespan so
+    clients are created after the worker forks and can be swapped out in tests.
+    """
+    def __init__(
+        self,
+        cache: Optional[CacheService] = None,
+        vector: Optional[VectorService] = None,
+        rag: Optional[RagService] = None,
+        admission: Optional[AdmissionService] = None,
+        index: Optional[IndexRegistry] = None,
+    ):
+        self.cache = cache or CacheService()
+        self.vector = vector or VectorService()
+        self.index = index or IndexRegistry()
+        self.dedup = DedupService(cache=self.cache)
+        self.rag = rag or RagService(cache=self.cache, vector=self.vector, index=self.index, dedup=self.dedup)
+        self.admission = admission or AdmissionService(cache=self.cache)
+        self.federated = FederatedSearchService(rag=self.rag, vector=self.vector, index=self.index)
+        self.conversation = ConversationService(rag=self.rag, cache=self.cache)
+        self.evaluation = EvaluationService(rag=self.rag)
+        self.warmer = CacheWarmerService(
+            rag=self.rag, index=self.index, cache=self.cache, admission=self.admission
+        )
+        self.analytics = AnalyticsService()
+        self.reindex = ReindexService(
+            rag=self.rag, vector=self.vector, index=self.index, cache=self.cache, admission=self.admission
+        )
+        self.reconciler = ReconcilerService(
+            rag=self.rag, vector=self.vector, index=self.index, cache=self.cache, admission=self.admission
+        )
+        self.ready = False
+        self.checks: Dict[str, str] = {}
+        self.warmup_seconds: Optional[float] = None
+        self._warming = asyncio.Lock()
+        self._became_ready = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Runs a long-lived background job owned by the container (cancelled on shutdown)."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self):
+        """Startup sequence run in the background by the lifespan."""
+        # Background loops don't depend on the warm-up; each tolerates unavailable backends.
+        if settings.RECONCILE_INTERVAL_SECONDS > 0:
+            self.spawn(self.reconciler.run_forever())
+        if settings.WARM_INTERVAL_SECONDS > 0:
+            self.spawn(self.warmer.run_forever())
+        if settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS > 0:
+            self.spawn(self.analytics.run_forever())
+        if settings.WARMUP_ON_STARTUP:
+            await self.warm_up()
+
+    @property
+    def warming(self) -> bool:
+        return self._warming.locked()
+
+    def _on_first_ready(self):
+        # Runs once, whether the startup warm-up or a later /ready retry got there first.
+        self.spawn(self.reindex.resume_pending())
+        if settings.WARM_CACHE_ON_STARTUP:
+            self.spawn(self.warmer.warm_after_deploy())
+
+    async def warm_up(self):
+        """
+        Opens connection pools and loads lazy state before traffic arrives.
+        Each check is recorded independently so /ready can report what failed.
+        Returns immediately if a warm-up is already running.
+        """
+        if self.warming:
+            return
+        async with self._warming:
+            await self._run_checks()
+            if self.ready and not self._became_ready:
+                self._became_ready = True
+                self._on_first_ready()
+
+    async def _run_checks(self):
+        from sqlalchemy import text
+        from app.db.session import engine
+
+        started = time.perf_counter()
+
+        async def check_db():
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        async def check_cache():
+            await self.cache.ping()
+
+        async def check_vector():
+            await asyncio.to_thread(self.vector.refresh_collections)
+            await self.index.load_all()
+
+        async def check_rag():
+            # Importing LangChain and loading the BPE ranks is CPU-bound; keep it off the loop.
+            await asyncio.to_thread(self.rag.prime_tokenizer)
+            await asyncio.to_thread(lambda: (self.rag.embeddings, self.rag.text_splitter))
+
+        checks = {
+            "database": check_db,
+            "cache": check_cache,
+            "vector": check_vector,
+            "rag": check_rag,
+        }
+        results = await asyncio.gather(*(fn() for fn in checks.values()), return_exceptions=True)
+        for name, result in zip(checks, results):
+            if isinstance(result, Exception):
+                logger.warning("Warm-up check %s failed: %s", name, result)
+                self.checks[name] = f"error: {result}"
+            else:
+                self.checks[name] = "ok"
+
+        self.warmup_seconds = round(time.perf_counter() - started, 3)
+        self.ready = all(status == "ok" for status in self.checks.values())
+
+    async def close(self):
+        self.ready = False
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.cache.close()
+        self.vector.close()
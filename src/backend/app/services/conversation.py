@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import uuid
+from typing import Optional
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.db import models
+from app.services.cache import CacheService
+from app.services.rag import RagService
+
+logger = logging.getLogger(__name__)
+
+REWRITE_PROMPT = """
+    Rewrite the user's latest question as a standalone question that can be understood
+    without the conversation. Resolve pronouns and implicit references from the
+    conversation; keep the wording otherwise. If it is already standalone, return it
+    unchanged. Reply with the question only.
+    """
+
+SUMMARY_PROMPT = """
+    Maintain a short running summary of a conversation with an internal knowledge
+    assistant. Merge the new turns into the summary: keep the topics, entities,
+    decisions and facts the user may refer back to, drop small talk and repetition.
+    Stay under {max_tokens} tokens. Reply with the updated summary only.
+    """
+
+class ConversationService:
+    """
+    Conversation state for multi-turn chat, kept at a constant size per turn.
+
+    A conversation stores a rolling summary of its older turns and its latest turn
+    verbatim. After each answer the turns behind the latest one are merged into the
+    summary with one small LLM call (run after the response is sent), so history is
+    never replayed.
+    Follow-up questions are rewritten into standalone ones for retrieval; rewrites
+    are cached by conversation state and question, which also makes the retrieval
+    cache apply to follow-ups.
+    """
+    def __init__(self, rag: RagService, cache: CacheService, session_factory=None):
+        self.rag = rag
+        self.cache = cache
+        self._session_factory = session_factory
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def history(self, conversation: models.Conversation) -> Optional[str]:
+        """The conversation so far, as given to the LLM (None for a new conversation)."""
+        parts = []
+        if conversation.summary:
+            parts.append(f"Summary of earlier turns: {conversation.summary}")
+        if conversation.last_question:
+            answer = conversation.last_answer or ""
+            if len(answer) > settings.CONVERSATION_TURN_MAX_CHARS:
+                answer = answer[:settings.CONVERSATION_TURN_MAX_CHARS] + "..."
+            parts.append(f"User: {conversation.last_question}\nAssistant: {answer}")
+        return "\n\n".join(parts) or None
+
+    async def standalone_question(self, conversation: models.Conversation, question: str) -> str:
+        """Rewrites a follow-up into a standalone question; falls back to the question as asked."""
+        from langchain_core.prompts import ChatPromptTemplate
+
+        history = self.history(conversation)
+        if not history:
+            return question
+
+        # 1. Check Cache
+        digest = hashlib.sha1(f"{history}\n{question}".encode("utf-8")).hexdigest()
+        cache_key = f"conv:rewrite:{digest}"
+        cached = await self.cache.get_cache(cache_key)
+        if cached:
+            return cached
+
+        # 2. Rewrite (instructions first, so the prefix is shared across conversations)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", REWRITE_PROMPT),
+            ("human", "CONVERSATION:\n{history}\n\nLATEST QUESTION:\n{question}"),
+        ])
+        chain = prompt | self.rag.llm.bind(max_tokens=settings.CONVERSATION_REWRITE_MAX_TOKENS, temperature=0)
+        try:
+            response = await chain.ainvoke({"history": history, "question": question})
+        except Exception as e:
+            logger.warning("Question rewrite failed for conversation %s: %s", conversation.id, e)
+            return question
+        rewritten = response.content.strip() or question
+
+        # 3. Set Cache
+        await self.cache.set_cache(cache_key, rewritten)
+        return rewritten
+
+    async def record_turn(self, db, conversation: models.Conversation, question: str, answer: str) -> int:
+        """
+        Makes this turn the latest one and returns its number (the caller commits,
+        together with its chat log). The count is incremented in SQL, which also locks
+        the row until commit, so concurrent follow-ups each get their own turn.
+        """
+        if conversation.id is None:
+            conversation.last_question = question
+            conversation.last_answer = answer
+            conversation.turns = 1
+            db.add(conversation)
+            await db.flush()
+            return 1
+        return (await db.execute(
+            update(models.Conversation)
+            .where(models.Conversation.id == conversation.id)
+            .values(turns=models.Conversation.turns + 1, last_question=question, last_answer=answer)
+            .returning(models.Conversation.turns)
+            .execution_options(synchronize_session=False)
+        )).scalar_one()
+
+    async def fold(self, conversation_id: uuid.UUID):
+        """
+        Merges every turn not yet in the summary, except the latest, into it. Runs in
+        the background after each answer. Folds of one conversation are serialized,
+        and the turns are read back from chat_logs, so a fold that fails or overlaps
+        another leaves them pending for the next one instead of losing them.
+        """
+        from langchain_core.prompts import ChatPromptTemplate
+        from redis.exceptions import LockError
+
+        try:
+            async with self.cache.redis.lock(f"conv:{conversation_id}:fold", timeout=120, blocking_timeout=120):
+                # 1. Find the pending turns (summary_turns + 1 .. turns - 1)
+                async with self.session_factory() as db:
+                    conversation = await db.get(models.Conversation, conversation_id)
+                    if conversation is None or conversation.summary_turns >= conversation.turns - 1:
+                        return
+                    summary, summarized, target = conversation.summary, conversation.summary_turns, conversation.turns - 1
+                    turns = (await db.execute(
+                        select(models.ChatLog.question, models.ChatLog.answer)
+                        .where(models.ChatLog.conversation_id == conversation_id)
+                        .order_by(models.ChatLog.created_at, models.ChatLog.id)
+                        .offset(summarized)
+                        .limit(target - summarized)
+                    )).all()
+                if len(turns) != target - summarized:
+                    logger.warning("Conversation %s is missing chat logs for turns %d-%d", conversation_id, summarized + 1, target)
+                    target = summarized + len(turns)
+                if not turns:
+                    return
+
+                # 2. Merge them into the summary with one call
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", SUMMARY_PROMPT),
+                    ("human", "CURRENT SUMMARY:\n{summary}\n\nNEW TURNS:\n{turns}"),
+                ])
+                chain = prompt | self.rag.llm.bind(max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS, temperature=0)
+                response = await chain.ainvoke({
+                    "summary": summary or "(empty)",
+                    "turns": "\n\n".join(
+                        f"User: {q}\nAssistant: {a[:settings.CONVERSATION_TURN_MAX_CHARS]}" for q, a in turns
+                    ),
+                    "max_tokens": settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+                })
+
+                # 3. Store it (guarded in case the lock expired mid-call)
+                async with self.session_factory() as db:
+                    await db.execute(
+                        update(models.Conversation)
+                        .where(models.Conversation.id == conversation_id, models.Conversation.summary_turns == summarized)
+                        .values(summary=response.content.strip(), summary_turns=target)
+                    )
+                    await db.commit()
+        except LockError:
+            logger.info("Summary of conversation %s is busy; pending turns are left for the next fold", conversation_id)
+        except Exception:
+            logger.exception("Summarizing conversation %s failed; pending turns are left for the next fold", conversation_id)
@@ -0,0 +1,131 @@
+import hashlib
+import random
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+from app.core.config import settings
+from app.services.cache import CacheService
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"\w+")
+
+@dataclass(frozen=True)
+class Fingerprint:
+    sha: str
+    signature: tuple
+
+def normalize(text: str) -> str:
+    """Case and whitespace-insensitive form used for exact matching (punctuation and signs are kept)."""
+    return " ".join(text.lower().split())
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+class MinHasher:
+    """
+    MinHash over word shingles. Permutations come from a fixed seed so signatures
+    computed by different workers are comparable.
+    """
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def _shingles(self, words: List[str]) -> set:
+        k = self.shingle_size
+        if len(words) <= k:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+    def fingerprint(self, text: str) -> Fingerprint:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+            for s in self._shingles(_WORD_RE.findall(text.lower()))
+        ]
+        signature = tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms)
+        return Fingerprint(sha=chunk_hash(text), signature=signature)
+
+    @staticmethod
+    def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+        """Estimated Jaccard similarity of the two shingle sets."""
+        return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+class DedupService:
+    """
+    Chunk deduplication within a project.
+
+    At ingest, a chunk whose normalized text exactly matches an existing chunk is
+    not embedded again; the new document is attached to the existing point. Only
+    exact matches share a point: near-duplicates often differ in the facts that
+    matter ("10 PTO days" vs "20 PTO days"), so they are stored separately and only
+    collapsed at retrieval time (`diversify`), where MinHash similarity is used.
+
+    Index (per project): dedup:{project}:exact, a hash of chunk sha -> point id. It
+    is an accelerator, not a source of truth: callers check that matched points
+    still exist before reusing them, and losing Redis only means new duplicates get
+    stored.
+    """
+    def __init__(self, cache: CacheService):
+        self.cache = cache
+        self.enabled = settings.DEDUP_ENABLED
+        self.threshold = settings.DEDUP_THRESHOLD
+        self.hasher = MinHasher(num_perm=settings.DEDUP_NUM_PERM, shingle_size=settings.DEDUP_SHINGLE_SIZE)
+
+    def fingerprint(self, text: str) -> Fingerprint:
+        return self.hasher.fingerprint(text)
+
+    def _key(self, project_id: str, suffix: str) -> str:
+        return f"dedup:{project_id}:{suffix}"
+
+    def lock(self, project_id: str):
+        """Serializes read-modify-write of shared point payloads within a project."""
+        return self.cache.redis.lock(self._key(project_id, "lock"), timeout=30, blocking_timeout=30)
+
+    async def find_matches(self, project_id: str, hashes: List[str]) -> List[Optional[str]]:
+        """Returns, per chunk hash, the point ID of an existing identical chunk or None."""
+        if not hashes:
+            return []
+        return list(await self.cache.redis.hmget(self._key(project_id, "exact"), hashes))
+
+    async def register(self, project_id: str, entries: Iterable[tuple]):
+        """Adds (point_id, chunk hash) pairs to the project's index."""
+        mapping = {sha: point_id for point_id, sha in entries}
+        pipe = self.cache.redis.pipeline(transaction=False)
+        for sha, point_id in mapping.items():
+            pipe.hsetnx(self._key(project_id, "exact"), sha, point_id)
+        await pipe.execute()
+
+    async def unregister(self, project_id: str, entries: Iterable[tuple]):
+        """Removes deleted (point_id, chunk hash) pairs if the index still points at them."""
+        entries = list(entries)
+        if not entries:
+            return
+        redis = self.cache.redis
+        exact_key = self._key(project_id, "exact")
+        owners = await redis.hmget(exact_key, [sha for _, sha in entries])
+        stale = [sha for (point_id, sha), owner in zip(entries, owners) if owner == point_id]
+        if stale:
+            await redis.hdel(exact_key, *stale)
+
+    async def drop_project(self, project_id: str):
+        keys = [key async for key in self.cache.redis.scan_iter(match=self._key(project_id, "*"), count=1000)]
+        for i in range(0, len(keys), 1000):
+            await self.cache.redis.delete(*keys[i:i + 1000])
+
+    def diversify(self, items: List[Dict], limit: int) -> List[Dict]:
+        """
+        Keeps the best-ranked item of each group of (near-)duplicates, so repeated
+        boilerplate doesn't crowd distinct sources out of the top-k window.
+        """
+        kept: List[Dict] = []
+        kept_fps: List[Fingerprint] = []
+        for item in items:
+            fp = self.fingerprint(item["content"])
+            if any(fp.sha == other.sha or MinHasher.similarity(fp.signature, other.signature) >= self.threshold for other in kept_fps):
+                continue
+            kept.append(item)
+            kept_fps.append(fp)
+            if len(kept) >= limit:
+                break
+        return kept
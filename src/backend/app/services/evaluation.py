@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.services.rag import RagService
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class EvalQuestion:
+    id: str
+    question: str
+    expected_sources: List[str] = field(default_factory=list)
+
+def load_questions(lines: Iterable[str]) -> List[EvalQuestion]:
+    """
+    Parses JSONL questions. Each line needs `question` (or `body`); `id` (or
+    `request_id`) and `expected_sources` (document titles) are optional.
+    """
+    questions = []
+    for n, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        text = row.get("question") or row.get("body")
+        if not text:
+            raise ValueError(f"Line {n}: missing 'question'")
+        questions.append(EvalQuestion(
+            id=str(row.get("id") or row.get("request_id") or n),
+            question=text,
+            expected_sources=list(row.get("expected_sources") or []),
+        ))
+    return questions
+
+def _source_matches(expected: str, title: str) -> bool:
+    expected, title = expected.strip().lower(), title.strip().lower()
+    return expected == title or expected in title
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+class EvaluationService:
+    """
+    Runs a question set through retrieval (and optionally generation) for one project
+    and reports quality, latency and token usage.
+
+    Retrieval goes through RagService.retrieve_many, i.e. one batched embedding
+    request and concurrent searches; answers are generated under their own
+    concurrency cap. The result cache is bypassed unless `use_cache` is set, so
+    runs measure the pipeline rather than Redis.
+    """
+    def __init__(self, rag: RagService):
+        self.rag = rag
+
+    async def run(
+        self,
+        tenant_id: str,
+        project_id: str,
+        questions: List[EvalQuestion],
+        top_k: Optional[int] = None,
+        generate: bool = False,
+        search_concurrency: Optional[int] = None,
+        answer_concurrency: Optional[int] = None,
+        use_cache: bool = False
+    ) -> Dict:
+        top_k = top_k or settings.RAG_TOP_K
+        started = time.perf_counter()
+
+        # 1. Retrieval for the whole set
+        stats: Dict = {}
+        contexts = await self.rag.retrieve_many(
+            tenant_id,
+            project_id,
+            [q.question for q in questions],
+            limit=top_k,
+            concurrency=search_concurrency or settings.EVAL_SEARCH_CONCURRENCY,
+            use_cache=use_cache,
+            stats=stats
+        )
+        retrieval_seconds = time.perf_counter() - started
+
+        results = []
+        for i, (q, context) in enumerate(zip(questions, contexts)):
+            titles = [d["title"] for d in context]
+            rank = next(
+                (r for r, title in enumerate(titles, start=1) if any(_source_matches(e, title) for e in q.expected_sources)),
+                None
+            )
+            found = [e for e in q.expected_sources if any(_source_matches(e, t) for t in titles)]
+            results.append({
+                "id": q.id,
+                "question": q.question,
+                "expected_sources": q.expected_sources,
+                "sources": [{"title": d["title"], "score": d["score"]} for d in context],
+                "hit": rank is not None if q.expected_sources else None,
+                "rank": rank,
+                "recall": len(found) / len(q.expected_sources) if q.expected_sources else None,
+                "search_ms": stats["search_ms"][i],
+            })
+
+        # 2. Optional generation, capped separately from retrieval
+        tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        generation_seconds = 0.0
+        if generate:
+            slots = asyncio.Semaphore(answer_concurrency or settings.EVAL_ANSWER_CONCURRENCY)
+
+            async def answer(q: EvalQuestion, context: List[Dict], result: Dict):
+                if not context:
+                    result["answer"] = None
+                    return
+                async with slots:
+                    answer_started = time.perf_counter()
+                    try:
+                        response = await self.rag.generate_answer(q.question, context)
+                    except Exception as e:
+                        logger.warning("Answer for %s failed: %s", q.id, e)
+                        result["error"] = str(e)
+                        return
+                    result["answer_ms"] = round((time.perf_counter() - answer_started) * 1000, 1)
+                result["answer"] = response.content
+                usage = (response.response_metadata or {}).get("token_usage") or {}
+                result["tokens"] = {key: usage.get(key, 0) for key in tokens}
+                for key in tokens:
+                    tokens[key] += usage.get(key, 0)
+
+            generation_started = time.perf_counter()
+            await asyncio.gather(*(answer(q, c, r) for q, c, r in zip(questions, contexts, results)))
+            generation_seconds = time.perf_counter() - generation_started
+
+        # 3. Summary
+        graded = [r for r in results if r["hit"] is not None]
+        summary = {
+            "project_id": project_id,
+            "questions": len(questions),
+            "graded": len(graded),
+            "top_k": top_k,
+            "hit_rate": sum(r["hit"] for r in graded) / len(graded) if graded else None,
+            "mrr": sum(1 / r["rank"] for r in graded if r["rank"]) / len(graded) if graded else None,
+            "recall": sum(r["recall"] for r in graded) / len(graded) if graded else None,
+            "cache_hits": stats["cache_hits"],
+            "timings": {
+                "total_seconds": round(time.perf_counter() - started, 3),
+                "retrieval_seconds": round(retrieval_seconds, 3),
+                "embed_seconds": round(stats["embed_seconds"], 3),
+                "search_seconds": round(stats["search_seconds"], 3),
+                "search_p50_ms": _percentile(stats["search_ms"], 50),
+                "search_p95_ms": _percentile(stats["search_ms"], 95),
+                "generation_seconds": round(generation_seconds, 3),
+                "answer_p50_ms": _percentile([r.get("answer_ms") for r in results], 50),
+                "answer_p95_ms": _percentile([r.get("answer_ms") for r in results], 95),
+            },
+            "tokens": {
+                # The embeddings API doesn't report usage; this is a tiktoken count.
+                "embedding_tokens": await asyncio.to_thread(
+                    self.rag.count_tokens,
+                    [q.question for q, ms in zip(questions, stats["search_ms"]) if ms is not None]
+                ),
+                **tokens,
+            },
+        }
+        return {"summary": summary, "results": results}
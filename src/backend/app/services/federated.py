@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.services.index import IndexRegistry
+from app.services.rag import RagService
+from app.services.vector import VectorService
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class FederatedResult:
+    results: List[Dict] = field(default_factory=list)
+    projects_searched: int = 0
+    timed_out: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+
+def _normalize_scores(items: List[Dict]):
+    """
+    Min-max normalizes scores within each embedding model. Cosine scores are
+    comparable across collections of the same model (so their order is kept as is),
+    but not across models, which is what the rescaling is for.
+    """
+    by_model: Dict[str, List[Dict]] = {}
+    for item in items:
+        by_model.setdefault(item.pop("model"), []).append(item)
+    for group in by_model.values():
+        low = min(item["score"] for item in group)
+        high = max(item["score"] for item in group)
+        for item in group:
+            item["score"] = (item["score"] - low) / (high - low) if high > low else 1.0
+
+class FederatedSearchService:
+    """
+    Searches several projects of one tenant with a single query and merges the hits
+    into one ranking.
+
+    The query is embedded once per embedding model in use, then every project's
+    collection is searched concurrently. Searches share a process-wide pool of
+    FEDERATED_MAX_CONCURRENCY slots, and a slot is only returned once Qdrant has
+    answered (even if we stopped waiting), so a tenant with many projects or a slow
+    cluster can't pile up requests. A shard that misses FEDERATED_SHARD_TIMEOUT is
+    left out and reported instead of failing the whole search.
+    """
+    def __init__(self, rag: RagService, vector: VectorService, index: IndexRegistry):
+        self.rag = rag
+        self.vector = vector
+        self.index = index
+        self.shard_timeout = settings.FEDERATED_SHARD_TIMEOUT
+        self._slots = asyncio.Semaphore(settings.FEDERATED_MAX_CONCURRENCY)
+
+    async def search(
+        self,
+        tenant_id: str,
+        project_ids: List[str],
+        query: str,
+        limit: int = 5,
+        filters: Optional[Dict] = None
+    ) -> FederatedResult:
+        report = FederatedResult(projects_searched=len(project_ids))
+        if not project_ids:
+            return report
+        filters = {k: v for k, v in (filters or {}).items() if v}
+
+        # 1. Resolve collections (registry cache) and embed once per model
+        infos = await self.index.resolve_many(tenant_id, project_ids)
+        models = sorted({info.active.model for info in infos})
+        vectors = dict(zip(models, await asyncio.gather(
+            *(self.rag.get_embeddings(model).aembed_query(query) for model in models)
+        )))
+
+        # 2. Fan out, bounded and with a per-shard timeout
+        fetch_limit = limit * settings.DEDUP_SEARCH_OVERFETCH if self.rag.dedup.enabled else limit
+        query_filter = self.vector.payload_filter(**filters) if filters else None
+        shards = await asyncio.gather(
+            *(
+                asyncio.wait_for(
+                    self._search_shard(info, vectors[info.active.model], fetch_limit, query_filter),
+                    timeout=self.shard_timeout
+                )
+                for info in infos
+            ),
+            return_exceptions=True
+        )
+
+        # 3. Merge by normalized score
+        merged = []
+        for info, hits in zip(infos, shards):
+            if isinstance(hits, asyncio.TimeoutError):
+                report.timed_out.append(info.project_id)
+                continue
+            if isinstance(hits, Exception):
+                logger.warning("Federated search of project %s failed: %s", info.project_id, hits)
+                report.failed.append(info.project_id)
+                continue
+            for item in self.rag.format_hits(hits, filters):
+                merged.append(dict(item, project_id=info.project_id, model=info.active.model))
+        _normalize_scores(merged)
+        merged.sort(key=lambda item: item["score"], reverse=True)
+        report.results = await self.rag.select_context(merged, limit)
+        return report
+
+    async def _search_shard(self, info, query_vector: list, limit: int, query_filter):
+        await self._slots.acquire()
+        try:
+            future = asyncio.ensure_future(asyncio.to_thread(
+                self.vector.search,
+                tenant_id=info.tenant_id,
+                project_id=info.project_id,
+                query_vector=query_vector,
+                limit=limit,
+                collection_name=info.active.name,
+                query_filter=query_filter
+            ))
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release)
+        # Shielded: a timeout abandons the wait, not the in-flight request holding the slot.
+        return await asyncio.shield(future)
+
+    def _release(self, future: asyncio.Future):
+        self._slots.release()
+        if not future.cancelled():
+            # Consume late errors of abandoned searches so they aren't logged as unretrieved.
+            future.exception()
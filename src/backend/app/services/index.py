@@ -0,0 +1,148 @@
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.config import settings
+from app.db import models
+from app.services.vector import embedding_dimension
+
+@dataclass(frozen=True)
+class CollectionTarget:
+    name: str
+    model: str
+    dim: int
+
+@dataclass(frozen=True)
+class ProjectIndexInfo:
+    tenant_id: str
+    project_id: str
+    version: int
+    active: CollectionTarget
+    shadow: Optional[CollectionTarget] = None
+
+    @property
+    def write_targets(self) -> List[CollectionTarget]:
+        """Collections every ingest/delete must reach: the active one plus any re-index shadow."""
+        return [self.active] + ([self.shadow] if self.shadow else [])
+
+def _info_from_row(tenant_id: str, row: models.ProjectIndex) -> ProjectIndexInfo:
+    shadow = None
+    if row.shadow_collection_name:
+        shadow = CollectionTarget(row.shadow_collection_name, row.shadow_embedding_model, row.shadow_embedding_dim)
+    return ProjectIndexInfo(
+        tenant_id=tenant_id,
+        project_id=str(row.project_id),
+        version=row.version,
+        active=CollectionTarget(row.collection_name, row.embedding_model, row.embedding_dim),
+        shadow=shadow,
+    )
+
+class IndexRegistry:
+    """
+    Resolves a project to the collection and embedding model that serve it.
+
+    Postgres (project_indexes) is the source of truth; each worker keeps a short
+    TTL cache so retrieval doesn't pay a DB round trip. After a cut-over, a stale
+    worker keeps querying the retired collection with its matching model until
+    the TTL expires, so a query never mixes models.
+    """
+    def __init__(self, session_factory=None, ttl: float = None):
+        self._session_factory = session_factory
+        self.ttl = settings.INDEX_REGISTRY_TTL if ttl is None else ttl
+        self._cache: Dict[str, Tuple[float, ProjectIndexInfo]] = {}
+
+    @property
+    def session_factory(self):
+        if self._session_factory is None:
+            from app.db.session import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    def default_collection_name(self, tenant_id: str, project_id: str) -> str:
+        return f"{tenant_id}_{project_id}"
+
+    def _default_row(self, tenant_id: str, project_id: str) -> Dict:
+        # First sight of a project: pin it to the current default model so a later
+        # change of RAG_EMBEDDING_MODEL can't silently mismatch its vectors.
+        return {
+            "project_id": uuid.UUID(project_id),
+            "collection_name": self.default_collection_name(tenant_id, project_id),
+            "embedding_model": settings.RAG_EMBEDDING_MODEL,
+            "embedding_dim": embedding_dimension(settings.RAG_EMBEDDING_MODEL),
+            "version": 1,
+            "reindex_done": 0,
+            "reindex_total": 0,
+        }
+
+    async def load_all(self) -> int:
+        """Pre-populates the cache with every project's index (startup warm-up)."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(models.ProjectIndex, models.Project.tenant_id)
+                .join(models.Project, models.Project.id == models.ProjectIndex.project_id)
+            )
+            now = time.monotonic()
+            for row, tenant_id in result.all():
+                self._cache[str(row.project_id)] = (now, _info_from_row(str(tenant_id), row))
+        return len(self._cache)
+
+    async def resolve(self, tenant_id: str, project_id: str) -> ProjectIndexInfo:
+        cached = self._cache.get(project_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        async with self.session_factory() as db:
+            row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+            if row is None:
+                await db.execute(
+                    pg_insert(models.ProjectIndex)
+                    .values(**self._default_row(tenant_id, project_id))
+                    .on_conflict_do_nothing(index_elements=["project_id"])
+                )
+                await db.commit()
+                row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+
+            info = _info_from_row(tenant_id, row)
+
+        self._cache[project_id] = (time.monotonic(), info)
+        return info
+
+    async def resolve_many(self, tenant_id: str, project_ids: List[str]) -> List[ProjectIndexInfo]:
+        """Like resolve, for several projects of one tenant; cache misses cost one query."""
+        now = time.monotonic()
+        infos: Dict[str, ProjectIndexInfo] = {}
+        for project_id in project_ids:
+            cached = self._cache.get(project_id)
+            if cached and now - cached[0] < self.ttl:
+                infos[project_id] = cached[1]
+        missing = [uuid.UUID(p) for p in dict.fromkeys(project_ids) if p not in infos]
+
+        if missing:
+            async with self.session_factory() as db:
+                query = select(models.ProjectIndex).where(models.ProjectIndex.project_id.in_(missing))
+                rows = {str(row.project_id): row for row in (await db.execute(query)).scalars().all()}
+                unregistered = [str(p) for p in missing if str(p) not in rows]
+                if unregistered:
+                    await db.execute(
+                        pg_insert(models.ProjectIndex)
+                        .values([self._default_row(tenant_id, p) for p in unregistered])
+                        .on_conflict_do_nothing(index_elements=["project_id"])
+                    )
+                    await db.commit()
+                    query = select(models.ProjectIndex).where(
+                        models.ProjectIndex.project_id.in_([uuid.UUID(p) for p in unregistered])
+                    )
+                    rows.update({str(row.project_id): row for row in (await db.execute(query)).scalars().all()})
+
+            now = time.monotonic()
+            for project_id, row in rows.items():
+                info = _info_from_row(tenant_id, row)
+                self._cache[project_id] = (now, info)
+                infos[project_id] = info
+
+        return [infos[p] for p in project_ids]
+
+    def invalidate(self, project_id: str):
+        self._cache.pop(project_id, None)
@@ -1,96 +1,449 @@
-from app.services.cache import cache_service
-from app.services.vector import vector_service
+from app.services.cache import CacheService
+from app.services.vector import VectorService, normalize_tags, title_prefixes, to_timestamp
+from app.services.index import IndexRegistry
+from app.services.dedup import DedupService, chunk_hash
 from app.core.config import settings
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
-import json
+from datetime import datetime
+from typing import List, Dict, Optional
 import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+# Projects whose corpus or index changed since the cache warmer last looked at them.
+CHANGED_PROJECTS_KEY = "rag:changed_projects"
+
+# The answer prompt is laid out from most to least stable (instructions, conversation,
+# retrieved context, question) so providers that cache prompt prefixes can reuse the
+# leading messages across calls.
+ANSWER_INSTRUCTIONS = """
+    You are an intelligent internal knowledge assistant.
+
+    INSTRUCTIONS:
+    1. Answer the user's question based EXCLUSIVELY on the provided context below.
+    2. The context contains up to {top_k} most relevant document chunks. Synthesize information from them to answer accurately.
+    3. Do not use outside knowledge or make up information.
+    4. If the answer cannot be found in the context, state clearly that you do not know.
+    5. You MUST cite the source of your information for every claim, using the format [Source Title].
+    """
+
+ANSWER_HISTORY = """
+    CONVERSATION SO FAR (use it to understand the question, not as a source):
+    {history}
+    """
+
+ANSWER_QUESTION = """
+    CONTEXT:
+    {context}
+
+    USER QUESTION:
+    {question}
+    """
+
+def _payload_doc_ids(payload: Dict) -> List[str]:
+    return list(payload.get("doc_ids") or [payload["doc_id"]])
+
+def _payload_sources(payload: Dict) -> List[Dict]:
+    return list(payload.get("sources") or [{"doc_id": payload["doc_id"], "title": payload["title"]}])
+
+def _filter_fields(sources: List[Dict]) -> Dict:
+    """Indexed metadata of a chunk; a shared chunk carries the union over its documents."""
+    return {
+        "tags": sorted({t for s in sources for t in s.get("tags") or []}),
+        "title_prefixes": sorted({p for s in sources for p in title_prefixes(s["title"])}),
+        "created_at": [s["created_at"] for s in sources if s.get("created_at") is not None],
+        "updated_at": [s["updated_at"] for s in sources if s.get("updated_at") is not None],
+    }
+
+def _title_matches(payload: Dict, prefix: str) -> bool:
+    prefix = prefix.strip().lower()
+    return any(s["title"].strip().lower().startswith(prefix) for s in _payload_sources(payload))
 
 class RagService:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            model=settings.RAG_EMBEDDING_MODEL,
-            api_key=settings.OPENAI_API_KEY
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            length_function=len
-        )
+    def __init__(self, cache: CacheService, vector: VectorService, index: IndexRegistry, dedup: DedupService):
+        self.cache = cache
+        self.vector = vector
+        self.index = index
+        self.dedup = dedup
+        self._embeddings = {}
+        self._text_splitter = None
+        self._llm = None
+
+    def get_embeddings(self, model: str):
+        """One embeddings client per model; projects may be served by different models."""
+        if model not in self._embeddings:
+            from langchain_openai import OpenAIEmbeddings
+            self._embeddings[model] = OpenAIEmbeddings(
+                model=model,
+                api_key=settings.OPENAI_API_KEY
+            )
+        return self._embeddings[model]
+
+    @property
+    def embeddings(self):
+        return self.get_embeddings(settings.RAG_EMBEDDING_MODEL)
 
-    async def ingest_document(self, tenant_id: str, project_id: str, doc_id: str, content: str, title: str):
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=settings.CHUNK_SIZE,
+                chunk_overlap=settings.CHUNK_OVERLAP,
+                length_function=len
+            )
+        return self._text_splitter
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI
+            self._llm = ChatOpenAI(model=settings.RAG_LLM_MODEL, api_key=settings.OPENAI_API_KEY)
+        return self._llm
+
+    def _encoding(self):
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(settings.RAG_EMBEDDING_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+
+    def prime_tokenizer(self):
+        """Loads the tiktoken encoding used for embedding requests so the first call doesn't pay for it."""
+        self._encoding()
+
+    def count_tokens(self, texts: List[str]) -> int:
+        encoding = self._encoding()
+        return sum(len(encoding.encode(text)) for text in texts)
+
+    async def ingest_document(
+        self,
+        tenant_id: str,
+        project_id: str,
+        doc_id: str,
+        content: str,
+        title: str,
+        tags: Optional[List[str]] = None,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None
+    ):
         """
         Chunks, embeds, and upserts a document into the vector database.
+        Tags and timestamps are stored as indexed payload fields for filtered retrieval.
+        Chunks identical to an existing chunk of the project are not embedded again;
+        the document is attached to the existing point instead.
         """
-        import uuid
-        
+        info = await self.index.resolve(tenant_id, project_id)
+
         # 1. Chunking
         chunks = self.text_splitter.split_text(content)
-        
-        # 2. Prepare Payloads
-        vectors = await self.embeddings.aembed_documents(chunks)
-        
+        if not chunks:
+            return
+
+        # 2. Duplicate detection (exact match on normalized text)
+        matches: List[Optional[str]] = [None] * len(chunks)
+        hashes = []
+        if self.dedup.enabled:
+            hashes = [chunk_hash(c) for c in chunks]
+            matches = await self.dedup.find_matches(project_id, hashes)
+            # Reuse only points that still exist; the index may lag behind deletes.
+            existing = {
+                str(p.id) for p in self.vector.retrieve_points(
+                    info.active.name, sorted({m for m in matches if m}), with_payload=False
+                )
+            }
+            matches = [m if m in existing else None for m in matches]
+
+        # 3. Prepare Payloads for chunks that need a vector of their own
+        source = {
+            "doc_id": doc_id,
+            "title": title,
+            "tags": normalize_tags(tags),
+            "created_at": to_timestamp(created_at) if created_at else None,
+            "updated_at": to_timestamp(updated_at) if updated_at else None,
+        }
         ids = []
         payloads = []
-        # vectors list is already ready
-        
+        new_chunks = []
+        new_hashes = []
+        seen = {}
         for i, chunk in enumerate(chunks):
+            if matches[i]:
+                continue
+            if hashes and hashes[i] in seen:
+                # Repeated within this document: one point is enough.
+                continue
             # Generate deterministic UUID for the chunk to ensure idempotency
             chunk_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{doc_id}_{i}"))
+            if hashes:
+                seen[hashes[i]] = chunk_uuid
+                new_hashes.append((chunk_uuid, hashes[i]))
             ids.append(chunk_uuid)
+            new_chunks.append(chunk)
             payloads.append({
                 "doc_id": doc_id,
+                "doc_ids": [doc_id],
+                "sources": [source],
                 "content": chunk,
                 "title": title,
-                "chunk_index": i
+                "chunk_index": i,
+                **_filter_fields([source])
             })
-            
-        # 3. Upsert to Qdrant
-        vector_service.ensure_collection_exists(tenant_id, project_id)
-        
-        vector_service.upsert_vectors(
-            tenant_id=tenant_id,
-            project_id=project_id,
-            ids=ids,
-            vectors=vectors,
-            payloads=payloads
+
+        # 4. Embed + Upsert to Qdrant (dual-write while a re-index shadow exists)
+        if new_chunks:
+            for target in info.write_targets:
+                vectors = await self.get_embeddings(target.model).aembed_documents(new_chunks)
+                self.vector.upsert_vectors(
+                    tenant_id=tenant_id,
+                    project_id=project_id,
+                    ids=ids,
+                    vectors=vectors,
+                    payloads=payloads,
+                    collection_name=target.name
+                )
+            if new_hashes:
+                await self.dedup.register(project_id, new_hashes)
+
+        # 5. Attach the document to the duplicates it shares
+        shared = sorted({m for m in matches if m})
+        if shared:
+            await self._attach_document(info, shared, source)
+        await self.mark_changed(project_id)
+
+    async def _attach_document(self, info, point_ids: List[str], source: Dict):
+        doc_id = source["doc_id"]
+        async with self.dedup.lock(info.project_id):
+            points = self.vector.retrieve_points(info.active.name, point_ids)
+            for point in points:
+                doc_ids = _payload_doc_ids(point.payload)
+                if doc_id in doc_ids:
+                    continue
+                sources = _payload_sources(point.payload) + [source]
+                payload = {
+                    "doc_ids": doc_ids + [doc_id],
+                    "sources": sources,
+                    **_filter_fields(sources)
+                }
+                for target in info.write_targets:
+                    self.vector.set_point_payload(target.name, str(point.id), payload)
+
+    async def mark_changed(self, project_id: str):
+        """Flags the project so the cache warmer refreshes its cached retrievals."""
+        await self.cache.redis.sadd(CHANGED_PROJECTS_KEY, project_id)
+
+    async def delete_document(self, tenant_id: str, project_id: str, doc_id: str):
+        """Removes a document's chunks from every collection serving the project."""
+        await self.delete_documents(tenant_id, project_id, [doc_id])
+
+    async def delete_documents(self, tenant_id: str, project_id: str, doc_ids: List[str]):
+        """
+        Detaches the documents from their chunks. Points no other document references
+        are deleted; shared points just drop the reference.
+        """
+        info = await self.index.resolve(tenant_id, project_id)
+        removed = set(doc_ids)
+        async with self.dedup.lock(project_id):
+            delete_ids = []
+            unregister = []
+            updates = {}
+            for points, _ in self.vector.iter_points(
+                tenant_id,
+                project_id,
+                with_payload=["doc_id", "doc_ids", "sources", "content", "title"],
+                collection_name=info.active.name,
+                scroll_filter=self.vector.doc_id_filter(doc_ids)
+            ):
+                for point in points:
+                    remaining = [d for d in _payload_doc_ids(point.payload) if d not in removed]
+                    if not remaining:
+                        delete_ids.append(str(point.id))
+                        if self.dedup.enabled:
+                            unregister.append((str(point.id), chunk_hash(point.payload["content"])))
+                        continue
+                    sources = [s for s in _payload_sources(point.payload) if s["doc_id"] not in removed]
+                    updates[str(point.id)] = {
+                        "doc_id": remaining[0],
+                        "doc_ids": remaining,
+                        "sources": sources,
+                        "title": sources[0]["title"] if sources else point.payload["title"],
+                        **_filter_fields(sources)
+                    }
+
+            for target in info.write_targets:
+                self.vector.delete_points(target.name, delete_ids)
+                # Shadow collections mirror the active one, so the same edits apply.
+                for point_id, payload in updates.items():
+                    self.vector.set_point_payload(target.name, point_id, payload)
+            if unregister:
+                await self.dedup.unregister(project_id, unregister)
+        await self.mark_changed(project_id)
+
+    async def ensure_project_index(self, tenant_id: str, project_id: str):
+        """Registers the project's index and creates its active collection."""
+        info = await self.index.resolve(tenant_id, project_id)
+        self.vector.ensure_collection_exists(
+            tenant_id, project_id, collection_name=info.active.name, dim=info.active.dim
         )
 
-    async def retrieve(self, tenant_id: str, project_id: str, query: str, limit: int = 5) -> List[Dict]:
+    def cache_key(self, info, query: str, filters: Dict, limit: int) -> str:
+        scope = None
+        if filters:
+            scope = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+        return self.cache.generate_key(info.tenant_id, info.project_id, query, version=info.version, scope=scope, limit=limit)
+
+    async def retrieve(
+        self,
+        tenant_id: str,
+        project_id: str,
+        query: str,
+        limit: int = 5,
+        filters: Optional[Dict] = None,
+        stats: Optional[Dict] = None
+    ) -> List[Dict]:
         """
         Retrieves relevant context for a query.
+        `filters` (see VectorService.payload_filter) narrow the search inside Qdrant.
+        `stats`, if given, gets `cache_hit` set.
         """
+        info = await self.index.resolve(tenant_id, project_id)
+        filters = {k: v for k, v in (filters or {}).items() if v}
+
         # 0. Check Cache
-        cache_key = cache_service.generate_key(tenant_id, project_id, query)
-        cached_data = await cache_service.get_cache(cache_key)
+        cache_key = self.cache_key(info, query, filters, limit)
+        cached_data = await self.cache.get_cache(cache_key)
+        if stats is not None:
+            stats["cache_hit"] = bool(cached_data)
         if cached_data:
              return json.loads(cached_data)
 
-        # 1. Embed Query
-        query_vector = await self.embeddings.aembed_query(query)
-        
-        # 2. Search in Vector DB
-        results = vector_service.search(
+        # 1. Embed Query with the model that produced the collection
+        query_vector = await self.get_embeddings(info.active.model).aembed_query(query)
+
+        # 2. Search in Vector DB (over-fetch so near-duplicates can be dropped)
+        fetch_limit = limit * settings.DEDUP_SEARCH_OVERFETCH if self.dedup.enabled else limit
+        results = self.vector.search(
             tenant_id=tenant_id,
             project_id=project_id,
             query_vector=query_vector,
-            limit=limit
+            limit=fetch_limit,
+            collection_name=info.active.name,
+            query_filter=self.vector.payload_filter(**filters) if filters else None
         )
-        
+
         # 3. Format Results
-        context = []
-        for hit in results:
-            context.append({
-                "content": hit.payload["content"],
-                "title": hit.payload["title"],
-                "score": hit.score
-            })
-            
+        context = await self.select_context(self.format_hits(results, filters), limit)
+
         # 4. Set Cache
         if context:
-            await cache_service.set_cache(cache_key, json.dumps(context))
+            await self.cache.set_cache(cache_key, json.dumps(context))
 
         return context
 
-rag_service = RagService()
+    async def retrieve_many(
+        self,
+        tenant_id: str,
+        project_id: str,
+        queries: List[str],
+        limit: int = 5,
+        filters: Optional[Dict] = None,
+        concurrency: int = 8,
+        use_cache: bool = True,
+        refresh: bool = False,
+        stats: Optional[Dict] = None
+    ) -> List[List[Dict]]:
+        """
+        Batch variant of retrieve: one cache round trip, one embedding request for all
+        cache misses, and concurrent searches (at most `concurrency` in flight).
+        `refresh` recomputes every query and overwrites its cache entry (cache warming).
+        `stats`, if given, receives cache hits, stage timings and per-query search times.
+        """
+        info = await self.index.resolve(tenant_id, project_id)
+        filters = {k: v for k, v in (filters or {}).items() if v}
+        contexts: List[Optional[List[Dict]]] = [None] * len(queries)
+        stats = stats if stats is not None else {}
+        stats.update(cache_hits=0, embed_seconds=0.0, search_seconds=0.0, search_ms=[None] * len(queries))
+
+        # 0. Check Cache
+        keys = [self.cache_key(info, q, filters, limit) for q in queries]
+        if use_cache and not refresh and queries:
+            for i, cached in enumerate(await self.cache.get_many(keys)):
+                if cached:
+                    contexts[i] = json.loads(cached)
+                    stats["cache_hits"] += 1
+        pending = [i for i, context in enumerate(contexts) if context is None]
+        if not pending:
+            return contexts
+
+        # 1. Embed all misses in one batched request
+        started = time.perf_counter()
+        vectors = await self.get_embeddings(info.active.model).aembed_documents([queries[i] for i in pending])
+        stats["embed_seconds"] = time.perf_counter() - started
+
+        # 2. Search concurrently
+        fetch_limit = limit * settings.DEDUP_SEARCH_OVERFETCH if self.dedup.enabled else limit
+        query_filter = self.vector.payload_filter(**filters) if filters else None
+        slots = asyncio.Semaphore(concurrency)
+
+        async def search(i: int, query_vector: list):
+            async with slots:
+                search_started = time.perf_counter()
+                hits = await asyncio.to_thread(
+                    self.vector.search,
+                    tenant_id=tenant_id,
+                    project_id=project_id,
+                    query_vector=query_vector,
+                    limit=fetch_limit,
+                    collection_name=info.active.name,
+                    query_filter=query_filter
+                )
+                stats["search_ms"][i] = round((time.perf_counter() - search_started) * 1000, 1)
+            contexts[i] = await self.select_context(self.format_hits(hits, filters), limit)
+            if (use_cache or refresh) and contexts[i]:
+                await self.cache.set_cache(keys[i], json.dumps(contexts[i]))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(search(i, v) for i, v in zip(pending, vectors)))
+        stats["search_seconds"] = time.perf_counter() - started
+        return contexts
+
+    def format_hits(self, hits, filters: Optional[Dict] = None) -> List[Dict]:
+        """Turns search hits into context items, applying checks Qdrant can't do exactly."""
+        prefix = (filters or {}).get("title_prefix")
+        return [
+            {
+                "content": hit.payload["content"],
+                "title": hit.payload["title"],
+                "score": hit.score
+            }
+            for hit in hits
+            if not prefix or _title_matches(hit.payload, prefix)
+        ]
+
+    async def select_context(self, context: List[Dict], limit: int) -> List[Dict]:
+        """Keeps the best `limit` items of a ranked list, collapsing near-duplicates."""
+        if self.dedup.enabled:
+            return await asyncio.to_thread(self.dedup.diversify, context, limit)
+        return context[:limit]
+
+    async def generate_answer(self, question: str, context_docs: List[Dict], history: Optional[str] = None):
+        """
+        Answers the question from the given context only. Returns the LLM message:
+        `content` is the answer, `response_metadata["token_usage"]` the token counts.
+        `history` is the conversation so far (see ConversationService.history).
+        """
+        from langchain_core.prompts import ChatPromptTemplate
+
+        context_text = "\n\n".join([f"Source: {d['title']}\n{d['content']}" for d in context_docs])
+        messages = [("system", ANSWER_INSTRUCTIONS)]
+        if history:
+            messages.append(("system", ANSWER_HISTORY))
+        messages.append(("human", ANSWER_QUESTION))
+        chain = ChatPromptTemplate.from_messages(messages) | self.llm
+        return await chain.ainvoke({
+            "context": context_text,
+            "question": question,
+            "history": history or "",
+            "top_k": settings.RAG_TOP_K
+        })
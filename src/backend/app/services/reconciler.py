@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import re
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.db import models
+from app.services.admission import AdmissionService
+from app.services.cache import CacheService
+from app.services.index import IndexRegistry
+from app.services.rag import RagService
+from app.services.snapshot import import_marker
+from app.services.vector import VectorService
+
+logger = logging.getLogger(__name__)
+
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+# Only collections following our naming scheme are ever considered for deletion.
+COLLECTION_NAME_RE = re.compile(rf"^(?P<tenant>{_UUID})_(?P<project>{_UUID})(?:_v\d+)?$")
+
+PENDING_DELETES_KEY = "reconcile:pending_deletes"
+LAST_REPORT_KEY = "reconcile:last_report"
+RUN_LOCK_KEY = "reconcile:running"
+
+class ReconcileBusy(Exception):
+    pass
+
+@dataclass
+class ReconcileReport:
+    mode: str
+    tenant_id: Optional[str] = None
+    started_at: str = ""
+    finished_at: str = ""
+    projects_checked: int = 0
+    documents_checked: int = 0
+    documents_requeued: int = 0
+    orphan_documents_purged: int = 0
+    orphan_collections_deleted: List[str] = field(default_factory=list)
+    retired_collections_dropped: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+class ReconcilerService:
+    """
+    Keeps Qdrant consistent with Postgres, which is the source of truth.
+
+    - Missing vectors: document IDs are streamed from Postgres in pages and looked up
+      in Qdrant with one filtered scroll per page; documents with no chunks are
+      re-ingested through the ingest pool.
+    - Orphan points: Qdrant is scrolled in pages (document references only) and each page's
+      distinct IDs are checked against Postgres with one query; unknown IDs are purged
+      with a single filtered delete. Projects with a snapshot import in flight are
+      skipped.
+    - Orphan collections: collections whose project no longer exists (or that are no
+      longer referenced by project_indexes) are dropped.
+
+    Memory stays bounded by the page size. Incremental runs only look at documents
+    created since the last watermark and at deletes whose vector cleanup failed; full
+    runs scan everything.
+    """
+    def __init__(
+        self,
+        rag: RagService,
+        vector: VectorService,
+        index: IndexRegistry,
+        cache: CacheService,
+        admission: AdmissionService,
+    ):
+        self.rag = rag
+        self.vector = vector
+        self.index = index
+        self.cache = cache
+        self.admission = admission
+        self.page_size = settings.RECONCILE_PAGE_SIZE
+
+    async def record_failed_delete(self, tenant_id: str, project_id: str, doc_id: str):
+        """Queues a document whose vector cleanup failed for the next run."""
+        await self.cache.redis.sadd(PENDING_DELETES_KEY, f"{tenant_id}:{project_id}:{doc_id}")
+
+    def _report_key(self, tenant_id: Optional[str]) -> str:
+        # Tenant-scoped runs keep their own report next to the global one.
+        return f"{LAST_REPORT_KEY}:{tenant_id}" if tenant_id else LAST_REPORT_KEY
+
+    async def last_report(self, tenant_id: Optional[str] = None) -> Optional[Dict]:
+        data = await self.cache.redis.get(self._report_key(tenant_id))
+        return json.loads(data) if data else None
+
+    async def acquire_run_lock(self) -> str:
+        """Takes the lock held for the duration of a run; raises ReconcileBusy if another run has it."""
+        token = str(uuid.uuid4())
+        if not await self.cache.redis.set(RUN_LOCK_KEY, token, nx=True, ex=settings.RECONCILE_LOCK_TTL):
+            raise ReconcileBusy("A reconcile is already running")
+        return token
+
+    async def run(self, full: bool = False, tenant_id: Optional[str] = None, lock_token: Optional[str] = None) -> ReconcileReport:
+        """
+        One reconcile pass, never concurrent with another (scheduled or admin-triggered).
+        Pass `lock_token` if the caller already took the run lock; it is released here.
+        """
+        token = lock_token or await self.acquire_run_lock()
+        try:
+            return await self._run(full, tenant_id)
+        finally:
+            if await self.cache.redis.get(RUN_LOCK_KEY) == token:
+                await self.cache.redis.delete(RUN_LOCK_KEY)
+
+    async def _run(self, full: bool, tenant_id: Optional[str]) -> ReconcileReport:
+        report = ReconcileReport(
+            mode="full" if full else "incremental",
+            tenant_id=tenant_id,
+            started_at=datetime.now(timezone.utc).isoformat(),
+        )
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.RECONCILE_GRACE_SECONDS)
+
+        async with self.index.session_factory() as db:
+            query = select(models.Project.id, models.Project.tenant_id)
+            if tenant_id:
+                query = query.where(models.Project.tenant_id == uuid.UUID(tenant_id))
+            projects = {str(pid): str(tid) for pid, tid in (await db.execute(query)).all()}
+
+        await self._reconcile_collections(projects, cutoff, tenant_id, report)
+        await self._process_pending_deletes(tenant_id, report)
+
+        requeue_budget = settings.RECONCILE_MAX_REQUEUE
+        for project_id, project_tenant in projects.items():
+            if await self.cache.redis.exists(import_marker(project_id)):
+                # Its points land before its documents commit; the next run checks it.
+                logger.info("Skipping project %s: snapshot import in progress", project_id)
+                continue
+            await self.cache.redis.expire(RUN_LOCK_KEY, settings.RECONCILE_LOCK_TTL)
+            try:
+                info = await self.index.resolve(project_tenant, project_id)
+                requeue_budget -= await self._requeue_missing(info, cutoff, full, requeue_budget, report)
+                if full:
+                    await self._purge_orphan_points(info, report)
+                report.projects_checked += 1
+            except Exception as e:
+                logger.exception("Reconcile failed for project %s", project_id)
+                report.errors.append(f"{project_id}: {e}")
+
+        report.finished_at = datetime.now(timezone.utc).isoformat()
+        await self.cache.redis.set(self._report_key(tenant_id), json.dumps(asdict(report)))
+        logger.info(
+            "Reconcile (%s): %d projects, %d requeued, %d orphan docs purged, %d collections dropped",
+            report.mode,
+            report.projects_checked,
+            report.documents_requeued,
+            report.orphan_documents_purged,
+            len(report.orphan_collections_deleted) + len(report.retired_collections_dropped),
+        )
+        return report
+
+    async def _reconcile_collections(self, projects: Dict[str, str], cutoff: datetime, tenant_id: Optional[str], report: ReconcileReport):
+        # List collections before reading project_indexes: a re-index records its shadow
+        # before creating it, so any collection seen here is already in the rows below.
+        # (A copy: the registry set also picks up collections created after this point.)
+        existing = set(await asyncio.to_thread(self.vector.refresh_collections))
+        async with self.index.session_factory() as db:
+            rows = (await db.execute(select(models.ProjectIndex))).scalars().all()
+        live: Dict[str, Set[str]] = {}
+        for row in rows:
+            if tenant_id and str(row.project_id) not in projects:
+                continue
+            names = {row.collection_name, row.shadow_collection_name}
+            if row.retired_collection_name:
+                if row.updated_at and row.updated_at < cutoff:
+                    # Past the cut-over grace period (normally dropped by the re-index job itself).
+                    await asyncio.to_thread(self.vector.delete_collection, row.retired_collection_name)
+                    report.retired_collections_dropped.append(row.retired_collection_name)
+                    existing.discard(row.retired_collection_name)
+                    async with self.index.session_factory() as db:
+                        fresh = await db.get(models.ProjectIndex, row.project_id)
+                        fresh.retired_collection_name = None
+                        await db.commit()
+                else:
+                    names.add(row.retired_collection_name)
+            live[str(row.project_id)] = {n for n in names if n}
+
+        for name in sorted(existing):
+            match = COLLECTION_NAME_RE.match(name)
+            if not match or (tenant_id and match["tenant"] != tenant_id):
+                continue
+            project_id = match["project"]
+            if project_id in projects:
+                default = self.index.default_collection_name(projects[project_id], project_id)
+                if name in live.get(project_id, {default}):
+                    continue
+            elif tenant_id is None:
+                # Not in this run's project set: only a global run can prove the project is gone.
+                async with self.index.session_factory() as db:
+                    if await db.get(models.Project, uuid.UUID(project_id)):
+                        continue
+            else:
+                continue
+            await asyncio.to_thread(self.vector.delete_collection, name)
+            if project_id not in projects:
+                await self.rag.dedup.drop_project(project_id)
+            report.orphan_collections_deleted.append(name)
+
+    async def _process_pending_deletes(self, tenant_id: Optional[str], report: ReconcileReport):
+        for member in await self.cache.redis.smembers(PENDING_DELETES_KEY):
+            member_tenant, project_id, doc_id = member.split(":")
+            if tenant_id and member_tenant != tenant_id:
+                continue
+            try:
+                await self.rag.delete_document(member_tenant, project_id, doc_id)
+                await self.cache.redis.srem(PENDING_DELETES_KEY, member)
+                report.orphan_documents_purged += 1
+            except Exception as e:
+                report.errors.append(f"pending delete {doc_id}: {e}")
+
+    async def _requeue_missing(self, info, cutoff: datetime, full: bool, budget: int, report: ReconcileReport) -> int:
+        """Re-ingests documents that have no chunks in the active collection; returns how many."""
+        watermark_key = f"reconcile:watermark:{info.project_id}"
+        since = None if full else await self.cache.redis.get(watermark_key)
+
+        query = (
+            select(models.Document.id, models.Document.created_at)
+            .where(models.Document.project_id == uuid.UUID(info.project_id))
+            .where(models.Document.created_at < cutoff)
+            # Whitespace-only documents produce no chunks and would look missing forever.
+            .where(func.length(func.trim(models.Document.content)) > 0)
+            .order_by(models.Document.created_at)
+            .execution_options(yield_per=self.page_size)
+        )
+        if since:
+            query = query.where(models.Document.created_at >= datetime.fromisoformat(since))
+
+        requeued = 0
+        resume_from = None
+        async with self.index.session_factory() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions(self.page_size):
+                page = {str(row.id): row.created_at for row in rows}
+                report.documents_checked += len(page)
+                missing = await self._missing_in_collection(info, list(page))
+                if not missing:
+                    continue
+                skipped = missing[budget - requeued:]
+                if skipped:
+                    # Out of budget: the next run must start at the first document left behind.
+                    resume_from = min(page[d] for d in skipped)
+                missing = missing[:budget - requeued]
+                # Separate session: the streaming one holds an open server-side cursor.
+                async with self.index.session_factory() as lookup:
+                    docs = (await lookup.execute(
+                        select(
+                            models.Document.id,
+                            models.Document.title,
+                            models.Document.content,
+                            models.Document.tags,
+                            models.Document.created_at,
+                            models.Document.updated_at,
+                        )
+                        .where(models.Document.id.in_([uuid.UUID(d) for d in missing]))
+                    )).all()
+                for doc in docs:
+                    await self.admission.run_ingest(
+                        self.rag.ingest_document,
+                        tenant_id=info.tenant_id,
+                        project_id=info.project_id,
+                        doc_id=str(doc.id),
+                        content=doc.content,
+                        title=doc.title,
+                        tags=doc.tags,
+                        created_at=doc.created_at,
+                        updated_at=doc.updated_at
+                    )
+                    requeued += 1
+                if resume_from:
+                    break
+
+        report.documents_requeued += requeued
+        await self.cache.redis.set(watermark_key, (resume_from or cutoff).isoformat())
+        return requeued
+
+    async def _missing_in_collection(self, info, doc_ids: List[str]) -> List[str]:
+        remaining = set(doc_ids)
+        pages = self.vector.iter_points(
+            info.tenant_id,
+            info.project_id,
+            page_size=self.page_size,
+            with_payload=["doc_id", "doc_ids"],
+            collection_name=info.active.name,
+            scroll_filter=self.vector.doc_id_filter(doc_ids),
+        )
+        while remaining:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            for point in page[0]:
+                remaining.difference_update(point.payload.get("doc_ids") or [point.payload["doc_id"]])
+        return [d for d in doc_ids if d in remaining]
+
+    async def _purge_orphan_points(self, info, report: ReconcileReport):
+        pages = self.vector.iter_points(
+            info.tenant_id,
+            info.project_id,
+            page_size=self.page_size,
+            with_payload=["doc_id", "doc_ids"],
+            collection_name=info.active.name,
+        )
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            doc_ids = set()
+            for point in page[0]:
+                doc_ids.update(point.payload.get("doc_ids") or [point.payload.get("doc_id")])
+            doc_ids.discard(None)
+            async with self.index.session_factory() as db:
+                known = await db.execute(
+                    select(models.Document.id)
+                    .where(models.Document.project_id == uuid.UUID(info.project_id))
+                    .where(models.Document.id.in_([uuid.UUID(d) for d in doc_ids]))
+                )
+                orphans = doc_ids - {str(row.id) for row in known.all()}
+            if orphans and await self.cache.redis.exists(import_marker(info.project_id)):
+                logger.info("Stopping orphan purge of %s: snapshot import started", info.project_id)
+                return
+            if orphans:
+                # Goes through RagService so shared (deduplicated) chunks are only detached.
+                await self.rag.delete_documents(info.tenant_id, info.project_id, sorted(orphans))
+                report.orphan_documents_purged += len(orphans)
+
+    async def run_forever(self):
+        """Scheduled loop; a Redis lock keeps it to one worker per interval."""
+        runs = 0
+        while True:
+            await asyncio.sleep(settings.RECONCILE_INTERVAL_SECONDS)
+            acquired = await self.cache.redis.set(
+                "reconcile:lock", "1", nx=True, ex=max(60, settings.RECONCILE_INTERVAL_SECONDS - 1)
+            )
+            if not acquired:
+                continue
+            runs += 1
+            try:
+                await self.run(full=runs % settings.RECONCILE_FULL_EVERY == 0)
+            except ReconcileBusy:
+                logger.info("Scheduled reconcile skipped: an admin-triggered run is in progress")
+            except Exception:
+                logger.exception("Scheduled reconcile failed")
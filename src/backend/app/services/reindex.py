@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import uuid
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.db import models
+from app.services.admission import AdmissionService
+from app.services.cache import CacheService
+from app.services.index import IndexRegistry
+from app.services.rag import RagService
+from app.services.vector import VectorService, embedding_dimension
+
+logger = logging.getLogger(__name__)
+
+class ReindexError(Exception):
+    pass
+
+class ReindexService:
+    """
+    Zero-downtime switch of a project's embedding model.
+
+    1. start: create a shadow collection and record it in project_indexes; from then
+       on ingest/delete write to both collections (see IndexRegistry.write_targets).
+    2. run: scroll the active collection in throttled batches, re-embed each chunk's
+       stored text with the new model and upsert it under the same point ID. The scroll
+       offset is checkpointed after every batch so the job resumes where it stopped.
+    3. cut over: one UPDATE swaps the shadow in as the active collection and bumps the
+       version. The old collection is kept as "retired" for a grace period so workers
+       with a cached view keep answering consistently, then dropped.
+
+    A job can be aborted at any point before the cut-over; its shadow is dropped.
+    """
+    def __init__(
+        self,
+        rag: RagService,
+        vector: VectorService,
+        index: IndexRegistry,
+        cache: CacheService,
+        admission: AdmissionService,
+    ):
+        self.rag = rag
+        self.vector = vector
+        self.index = index
+        self.cache = cache
+        self.admission = admission
+
+    def _lock_key(self, project_id: str) -> str:
+        return f"reindex:lock:{project_id}"
+
+    async def start(self, tenant_id: str, project_id: str, embedding_model: str) -> models.ProjectIndex:
+        dim = embedding_dimension(embedding_model)
+        info = await self.index.resolve(tenant_id, project_id)
+        if info.shadow:
+            row = await self.status(project_id)
+            if row.reindex_status == "failed" and row.shadow_embedding_model == embedding_model:
+                # Retry a failed job from its last checkpoint.
+                async with self.index.session_factory() as db:
+                    row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+                    row.reindex_status = "running"
+                    row.reindex_error = None
+                    await db.commit()
+                    await db.refresh(row)
+                return row
+            raise ReindexError("A re-index is already in progress for this project")
+        if info.active.model == embedding_model:
+            raise ReindexError(f"Project is already embedded with {embedding_model}")
+
+        shadow_name = f"{self.index.default_collection_name(tenant_id, project_id)}_v{info.version + 1}"
+        # A leftover from a failed attempt would hold vectors of unknown provenance.
+        self.vector.delete_collection(shadow_name)
+
+        # Record the shadow before creating it so the reconciler never sees it unreferenced.
+        async with self.index.session_factory() as db:
+            row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+            row.shadow_collection_name = shadow_name
+            row.shadow_embedding_model = embedding_model
+            row.shadow_embedding_dim = dim
+            row.reindex_status = "running"
+            row.reindex_cursor = None
+            row.reindex_done = 0
+            row.reindex_total = self.vector.count(info.active.name)
+            row.reindex_error = None
+            await db.commit()
+            await db.refresh(row)
+        self.vector.ensure_collection_exists(tenant_id, project_id, collection_name=shadow_name, dim=dim)
+        self.index.invalidate(project_id)
+        return row
+
+    async def status(self, project_id: str) -> models.ProjectIndex:
+        async with self.index.session_factory() as db:
+            return await db.get(models.ProjectIndex, uuid.UUID(project_id))
+
+    async def run(self, tenant_id: str, project_id: str, wait_for_dual_write: bool = True) -> bool:
+        """
+        Copies the active collection into the shadow one, then cuts over. Safe to call
+        again to resume. Returns False if another worker holds the job's lock.
+        """
+        token = str(uuid.uuid4())
+        lock_key = self._lock_key(project_id)
+        if not await self.cache.redis.set(lock_key, token, nx=True, ex=settings.REINDEX_LOCK_TTL):
+            logger.info("Re-index of %s is already running on another worker", project_id)
+            return False
+
+        shadow_name = None
+        try:
+            if wait_for_dual_write:
+                # Let every worker's registry cache expire so all new ingests dual-write
+                # before the scan starts; anything written earlier is picked up by the scan.
+                await asyncio.sleep(self.index.ttl * 2)
+
+            async with self.index.session_factory() as db:
+                row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+                if not row or row.reindex_status != "running" or not row.shadow_collection_name:
+                    return True
+                active_name = row.collection_name
+                shadow_name = row.shadow_collection_name
+                model = row.shadow_embedding_model
+                cursor = row.reindex_cursor
+
+            embeddings = self.rag.get_embeddings(model)
+            pages = self.vector.iter_points(
+                tenant_id,
+                project_id,
+                page_size=settings.REINDEX_BATCH_SIZE,
+                collection_name=active_name,
+                offset=cursor,
+            )
+            while True:
+                async with self.admission.ingest_slot():
+                    page = await asyncio.to_thread(next, pages, None)
+                    if page is None:
+                        break
+                    points, next_offset = page
+                    vectors = await embeddings.aembed_documents([p.payload["content"] for p in points])
+                    # Deletes and shared-point edits take this lock and apply to both
+                    # collections, so re-read the batch under it: a point deleted since
+                    # the scroll must not be resurrected in the shadow, and edited
+                    # payloads must not be rolled back.
+                    async with self.rag.dedup.lock(project_id):
+                        current = {
+                            str(p.id): p for p in await asyncio.to_thread(
+                                self.vector.retrieve_points, active_name, [p.id for p in points]
+                            )
+                        }
+                        batch = [
+                            (current[str(p.id)], vector) for p, vector in zip(points, vectors)
+                            # Re-ingested content was dual-written to the shadow already.
+                            if str(p.id) in current and current[str(p.id)].payload.get("content") == p.payload["content"]
+                        ]
+                        if batch:
+                            self.vector.upsert_vectors(
+                                tenant_id=tenant_id,
+                                project_id=project_id,
+                                ids=[p.id for p, _ in batch],
+                                vectors=[vector for _, vector in batch],
+                                payloads=[p.payload for p, _ in batch],
+                                collection_name=shadow_name
+                            )
+
+                async with self.index.session_factory() as db:
+                    result = await db.execute(
+                        update(models.ProjectIndex)
+                        .where(
+                            models.ProjectIndex.project_id == uuid.UUID(project_id),
+                            models.ProjectIndex.shadow_collection_name == shadow_name,
+                        )
+                        .values(
+                            reindex_cursor=str(next_offset) if next_offset is not None else None,
+                            reindex_done=models.ProjectIndex.reindex_done + len(points),
+                        )
+                    )
+                    await db.commit()
+                if not result.rowcount:
+                    logger.info("Re-index of %s was aborted", project_id)
+                    return True
+                await self.cache.redis.expire(lock_key, settings.REINDEX_LOCK_TTL)
+                await asyncio.sleep(settings.REINDEX_BATCH_DELAY)
+
+            retired = await self._cut_over(project_id, shadow_name)
+        except Exception as e:
+            logger.exception("Re-index of %s failed", project_id)
+            if shadow_name:
+                # Guarded: an aborted job keeps its "aborted" status.
+                async with self.index.session_factory() as db:
+                    await db.execute(
+                        update(models.ProjectIndex)
+                        .where(
+                            models.ProjectIndex.project_id == uuid.UUID(project_id),
+                            models.ProjectIndex.shadow_collection_name == shadow_name,
+                        )
+                        .values(reindex_status="failed", reindex_error=str(e))
+                    )
+                    await db.commit()
+            return True
+        finally:
+            if await self.cache.redis.get(lock_key) == token:
+                await self.cache.redis.delete(lock_key)
+
+        if retired:
+            await asyncio.sleep(self.index.ttl * 2)
+            await self.drop_retired(project_id)
+        return True
+
+    async def abort(self, project_id: str) -> str:
+        """
+        Cancels a running or failed job: the project stops dual-writing and a running
+        job stops at its next checkpoint. Returns the shadow collection, which the
+        caller drops with drop_aborted once stale workers stopped writing to it.
+        """
+        async with self.index.session_factory() as db:
+            row = await db.get(models.ProjectIndex, uuid.UUID(project_id), with_for_update=True)
+            if not row or not row.shadow_collection_name:
+                raise ReindexError("No re-index in progress for this project")
+            shadow_name = row.shadow_collection_name
+            row.shadow_collection_name = None
+            row.shadow_embedding_model = None
+            row.shadow_embedding_dim = None
+            row.reindex_status = "aborted"
+            row.reindex_cursor = None
+            row.reindex_error = None
+            await db.commit()
+        self.index.invalidate(project_id)
+        logger.info("Re-index of %s aborted", project_id)
+        return shadow_name
+
+    async def drop_aborted(self, shadow_name: str):
+        await asyncio.sleep(self.index.ttl * 2)
+        self.vector.delete_collection(shadow_name)
+
+    async def _cut_over(self, project_id: str, shadow_name: str):
+        """Atomically promotes the shadow collection; returns the retired collection name."""
+        async with self.index.session_factory() as db:
+            row = await db.get(models.ProjectIndex, uuid.UUID(project_id), with_for_update=True)
+            if row.shadow_collection_name != shadow_name:
+                raise ReindexError("Shadow collection changed during re-index")
+            retired = row.collection_name
+            row.collection_name = row.shadow_collection_name
+            row.embedding_model = row.shadow_embedding_model
+            row.embedding_dim = row.shadow_embedding_dim
+            row.version = row.version + 1
+            row.retired_collection_name = retired
+            row.shadow_collection_name = None
+            row.shadow_embedding_model = None
+            row.shadow_embedding_dim = None
+            row.reindex_status = "completed"
+            row.reindex_cursor = None
+            await db.commit()
+        self.index.invalidate(project_id)
+        # New version, new cache keys: let the warmer refill the popular questions.
+        await self.rag.mark_changed(project_id)
+        logger.info("Project %s cut over to %s", project_id, shadow_name)
+        return retired
+
+    async def drop_retired(self, project_id: str):
+        async with self.index.session_factory() as db:
+            row = await db.get(models.ProjectIndex, uuid.UUID(project_id))
+            if not row or not row.retired_collection_name:
+                return
+            self.vector.delete_collection(row.retired_collection_name)
+            row.retired_collection_name = None
+            await db.commit()
+
+    async def resume_pending(self):
+        """Resumes jobs interrupted by a restart (called after startup warm-up)."""
+        async def resume(tenant_id: str, project_id: str):
+            # A worker that died mid-job leaves its lock behind until REINDEX_LOCK_TTL
+            # runs out; keep trying until it does (or the job finishes elsewhere).
+            while not await self.run(tenant_id, project_id, wait_for_dual_write=False):
+                await asyncio.sleep(settings.REINDEX_LOCK_TTL / 4)
+
+        async with self.index.session_factory() as db:
+            result = await db.execute(
+                select(models.ProjectIndex.project_id, models.Project.tenant_id)
+                .join(models.Project, models.Project.id == models.ProjectIndex.project_id)
+                .where(models.ProjectIndex.reindex_status == "running")
+            )
+            pending = result.all()
+        for project_id, tenant_id in pending:
+            logger.info("Resuming re-index of project %s", project_id)
+        await asyncio.gather(*(resume(str(tenant_id), str(project_id)) for project_id, tenant_id in pending))
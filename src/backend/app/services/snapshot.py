@@ -0,0 +1,269 @@
+import json
+import struct
+import sys
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db import models
+from app.services.cache import CacheService
+from app.services.index import IndexRegistry
+from app.services.vector import VectorService
+
+# Archive layout (all integers little-endian):
+#   MAGIC, uint16 format version, then frames of: 1-byte kind, uint32 body length, body.
+#   H  header     zlib(JSON) project + embedding metadata
+#   D  documents  zlib(JSON list) of document rows
+#   P  points     uint32 count, uint32 dim, uint32 meta length, zlib(JSON {ids, payloads}),
+#                 then count * dim float32 vectors
+#   E  trailer    JSON totals, used to detect truncated archives
+# Documents always precede points so import can remap doc IDs in a single pass.
+MAGIC = b"AURASNAP"
+FORMAT_VERSION = 1
+FRAME_HEADER = struct.Struct("<cI")
+POINTS_HEADER = struct.Struct("<III")
+
+class SnapshotError(Exception):
+    pass
+
+def import_marker(project_id: str) -> str:
+    """Redis key present while an import into the project is in flight (see ReconcilerService)."""
+    return f"snapshot:importing:{project_id}"
+
+def _write_frame(out: BinaryIO, kind: bytes, body: bytes):
+    out.write(FRAME_HEADER.pack(kind, len(body)))
+    out.write(body)
+
+def _pack_json(data) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), 6)
+
+def _unpack_json(body: bytes):
+    return json.loads(zlib.decompress(body))
+
+def _pack_vectors(vectors: List[List[float]]) -> bytes:
+    block = array("f")
+    for vector in vectors:
+        block.extend(vector)
+    if sys.byteorder == "big":
+        block.byteswap()
+    return block.tobytes()
+
+def _unpack_vectors(data: bytes, count: int, dim: int) -> List[List[float]]:
+    block = array("f")
+    block.frombytes(data)
+    if sys.byteorder == "big":
+        block.byteswap()
+    if len(block) != count * dim:
+        raise SnapshotError("Vector block size does not match its header")
+    return [block[i * dim:(i + 1) * dim].tolist() for i in range(count)]
+
+def read_frames(src: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    """Yields (kind, body) frames from an archive stream."""
+    if src.read(len(MAGIC)) != MAGIC:
+        raise SnapshotError("Not a knowledge-base snapshot")
+    (version,) = struct.unpack("<H", src.read(2))
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+    while True:
+        head = src.read(FRAME_HEADER.size)
+        if not head:
+            raise SnapshotError("Snapshot is truncated (missing trailer)")
+        kind, length = FRAME_HEADER.unpack(head)
+        body = src.read(length)
+        if len(body) != length:
+            raise SnapshotError("Snapshot is truncated")
+        yield kind, body
+        if kind == b"E":
+            return
+
+class SnapshotService:
+    """
+    Exports a project's documents, chunk payloads and vectors into one streamable
+    archive and bulk-loads it back without calling the embedding API.
+    """
+    def __init__(self, vector: VectorService, index: IndexRegistry, cache: CacheService, batch_size: int = 1000):
+        self.vector = vector
+        self.index = index
+        self.cache = cache
+        self.batch_size = batch_size
+
+    async def export_project(self, db: AsyncSession, project_id: uuid.UUID, out: BinaryIO) -> Dict[str, int]:
+        project = await db.get(models.Project, project_id)
+        if not project:
+            raise SnapshotError(f"Project {project_id} not found")
+        tenant_id, project_key = str(project.tenant_id), str(project.id)
+        info = await self.index.resolve(tenant_id, project_key)
+
+        out.write(MAGIC)
+        out.write(struct.pack("<H", FORMAT_VERSION))
+        _write_frame(out, b"H", _pack_json({
+            "project": {
+                "id": project_key,
+                "tenant_id": tenant_id,
+                "name": project.name,
+                "description": project.description,
+                "department": project.department,
+            },
+            "embedding_model": info.active.model,
+            "dimension": info.active.dim,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+        }))
+
+        # 1. Documents, streamed with a server-side cursor
+        doc_count = 0
+        result = await db.stream(
+            select(
+                models.Document.id,
+                models.Document.title,
+                models.Document.content,
+                models.Document.file_path,
+                models.Document.tags,
+                models.Document.created_at,
+                models.Document.updated_at,
+            )
+            .where(models.Document.project_id == project.id)
+            .execution_options(yield_per=self.batch_size)
+        )
+        async for rows in result.partitions(self.batch_size):
+            _write_frame(out, b"D", _pack_json([
+                {
+                    "id": str(row.id),
+                    "title": row.title,
+                    "content": row.content,
+                    "file_path": row.file_path,
+                    "tags": row.tags or [],
+                    "created_at": row.created_at.isoformat() if row.created_at else None,
+                    "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+                }
+                for row in rows
+            ]))
+            doc_count += len(rows)
+
+        # 2. Points, paged out of Qdrant with their vectors
+        point_count = 0
+        for points, _ in self.vector.iter_points(
+            tenant_id, project_key, page_size=self.batch_size, with_vectors=True, collection_name=info.active.name
+        ):
+            dim = len(points[0].vector)
+            meta = _pack_json({
+                "ids": [str(p.id) for p in points],
+                "payloads": [p.payload for p in points],
+            })
+            _write_frame(
+                out,
+                b"P",
+                POINTS_HEADER.pack(len(points), dim, len(meta)) + meta + _pack_vectors([p.vector for p in points])
+            )
+            point_count += len(points)
+
+        _write_frame(out, b"E", json.dumps({"documents": doc_count, "points": point_count}).encode("utf-8"))
+        return {"documents": doc_count, "points": point_count}
+
+    async def import_project(self, db: AsyncSession, project_id: uuid.UUID, src: BinaryIO) -> Dict[str, int]:
+        """
+        Loads an archive into an existing project. Documents get fresh IDs so the same
+        snapshot can be restored next to its source. Point IDs are derived from the
+        exported point ID (a shared chunk's ID need not match its doc_id/chunk_index
+        after deletes) namespaced by the new document ID, so imports never collide.
+
+        Points are written before their documents are committed, so the reconciler
+        skips the project while the import is in flight. Documents are created at
+        import time, so the next incremental reconcile checks them.
+        """
+        project = await db.get(models.Project, project_id)
+        if not project:
+            raise SnapshotError(f"Project {project_id} not found")
+        tenant_id, project_key = str(project.tenant_id), str(project.id)
+        info = await self.index.resolve(tenant_id, project_key)
+        if info.shadow:
+            raise SnapshotError("Project is being re-indexed; import after the cut-over completes")
+        collection = info.active.name
+
+        doc_ids: Dict[str, str] = {}
+        doc_count = point_count = 0
+        marker = import_marker(project_key)
+        try:
+            for kind, body in read_frames(src):
+                await self.cache.redis.set(marker, "1", ex=settings.RECONCILE_GRACE_SECONDS)
+                if kind == b"H":
+                    header = _unpack_json(body)
+                    # Vectors of different models are never mixed in one collection, even at equal dimension.
+                    if header["embedding_model"] != info.active.model:
+                        raise SnapshotError(
+                            f"Snapshot was embedded with {header['embedding_model']}, "
+                            f"this project uses {info.active.model}; re-index the project to that model first"
+                        )
+                    if header["dimension"] != info.active.dim:
+                        raise SnapshotError("Snapshot vector dimension does not match the collection")
+                    self.vector.ensure_collection_exists(tenant_id, project_key, collection_name=collection, dim=info.active.dim)
+
+                elif kind == b"D":
+                    rows = []
+                    now = datetime.now(timezone.utc)
+                    for doc in _unpack_json(body):
+                        new_id = uuid.uuid4()
+                        doc_ids[doc["id"]] = str(new_id)
+                        rows.append({
+                            "id": new_id,
+                            "project_id": project.id,
+                            "title": doc["title"],
+                            "content": doc["content"],
+                            "file_path": doc["file_path"],
+                            "tags": doc.get("tags") or [],
+                            "created_at": now,
+                            "updated_at": datetime.fromisoformat(doc["updated_at"]) if doc["updated_at"] else now,
+                        })
+                    if rows:
+                        await db.execute(insert(models.Document), rows)
+                    doc_count += len(rows)
+
+                elif kind == b"P":
+                    count, dim, meta_len = POINTS_HEADER.unpack_from(body)
+                    offset = POINTS_HEADER.size
+                    meta = _unpack_json(body[offset:offset + meta_len])
+                    vectors = _unpack_vectors(body[offset + meta_len:], count, dim)
+                    ids, payloads = [], []
+                    for old_id, payload in zip(meta["ids"], meta["payloads"]):
+                        new_doc_id = doc_ids.get(payload["doc_id"])
+                        if new_doc_id is None:
+                            raise SnapshotError(f"Point references unknown document {payload['doc_id']}")
+                        payload = dict(payload, doc_id=new_doc_id)
+                        if "doc_ids" in payload:
+                            # Shared (deduplicated) chunk: remap every document that references it.
+                            payload["doc_ids"] = [doc_ids[d] for d in payload["doc_ids"] if d in doc_ids]
+                            payload["sources"] = [
+                                dict(s, doc_id=doc_ids[s["doc_id"]]) for s in payload.get("sources", []) if s["doc_id"] in doc_ids
+                            ]
+                        ids.append(str(uuid.uuid5(uuid.UUID(new_doc_id), old_id)))
+                        payloads.append(payload)
+                    self.vector.upsert_vectors(
+                        tenant_id=tenant_id,
+                        project_id=project_key,
+                        ids=ids,
+                        vectors=vectors,
+                        payloads=payloads,
+                        # Applied before moving on, so a rollback delete can't race it.
+                        wait=True,
+                        collection_name=collection
+                    )
+                    point_count += count
+
+                elif kind == b"E":
+                    totals = json.loads(body)
+                    if totals != {"documents": doc_count, "points": point_count}:
+                        raise SnapshotError(f"Snapshot totals mismatch: expected {totals}")
+
+            await db.commit()
+        except BaseException:
+            # Roll back Postgres and remove any points already written for the new IDs.
+            await db.rollback()
+            self.vector.delete_vectors_by_doc_ids(tenant_id, project_key, list(doc_ids.values()), collection_name=collection)
+            raise
+        finally:
+            await self.cache.redis.delete(marker)
+
+        return {"documents": doc_count, "points": point_count}
@@ -1,79 +1,319 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
+from datetime import datetime, timezone
+from typing import List, Optional, Set
 from app.core.config import settings
 
+# Output sizes of the OpenAI embedding models we support.
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+def embedding_dimension(model: str) -> int:
+    if model not in EMBEDDING_DIMENSIONS:
+        raise ValueError(f"Unknown embedding model: {model}")
+    return EMBEDDING_DIMENSIONS[model]
+
+# Chunk payload fields with a Qdrant payload index, so metadata filters are applied
+# inside the HNSW search instead of after it.
+PAYLOAD_INDEXES = {
+    "doc_id": "keyword",
+    "doc_ids": "keyword",
+    "tags": "keyword",
+    "title_prefixes": "keyword",
+    "created_at": "float",
+    "updated_at": "float",
+}
+# Title prefixes are stored up to this length; longer filters are checked on the hits.
+TITLE_PREFIX_MAX_LEN = 32
+
+def to_timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def normalize_tags(tags) -> List[str]:
+    return sorted({t.strip().lower() for t in tags or [] if t and t.strip()})
+
+def title_prefixes(title: str) -> List[str]:
+    key = title.strip().lower()[:TITLE_PREFIX_MAX_LEN]
+    return [key[:i] for i in range(1, len(key) + 1)]
+
 class VectorService:
-    def __init__(self):
-        self.client = QdrantClient(url=settings.QDRANT_URL)
-        self.embedding_size = 1536  # OpenAI text-embedding-3-small dimension
+    def __init__(self, url: Optional[str] = None, client=None):
+        # The Qdrant client (and qdrant_client itself) is created on first use,
+        # so importing this module stays cheap and forked workers don't share sockets.
+        self.url = url or settings.QDRANT_URL
+        self._client = client
+        self.embedding_size = embedding_dimension(settings.RAG_EMBEDDING_MODEL)
+        self._known_collections: Set[str] = set()
+        self._indexed_collections: Set[str] = set()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from qdrant_client import QdrantClient
+            self._client = QdrantClient(url=self.url)
+        return self._client
 
     def _get_collection_name(self, tenant_id: str, project_id: str) -> str:
         """Constructs the namespace-isolated collection name."""
         return f"{tenant_id}_{project_id}"
 
-    def ensure_collection_exists(self, tenant_id: str, project_id: str):
+    def refresh_collections(self) -> Set[str]:
+        """Reloads the collection registry from Qdrant."""
+        collections = self.client.get_collections().collections
+        self._known_collections = {c.name for c in collections}
+        return self._known_collections
+
+    def ensure_collection_exists(self, tenant_id: str, project_id: str, collection_name: Optional[str] = None, dim: Optional[int] = None):
         """Creates the collection if it doesn't exist."""
-        collection_name = self._get_collection_name(tenant_id, project_id)
+        from qdrant_client.http import models
+
+        collection_name = collection_name or self._get_collection_name(tenant_id, project_id)
         if not self._collection_exists(collection_name):
             self.client.create_collection(
                 collection_name=collection_name,
                 vectors_config=models.VectorParams(
-                    size=self.embedding_size,
+                    size=dim or self.embedding_size,
                     distance=models.Distance.COSINE
                 )
             )
+            self._known_collections.add(collection_name)
+        self.ensure_payload_indexes(collection_name)
+
+    def ensure_payload_indexes(self, collection_name: str):
+        """Creates the payload indexes used by filtered search; once per collection per process."""
+        from qdrant_client.http import models
+
+        if collection_name in self._indexed_collections:
+            return
+        for field_name, schema in PAYLOAD_INDEXES.items():
+            # Idempotent on the Qdrant side, so collections created before a field existed catch up here.
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType(schema)
+            )
+        self._indexed_collections.add(collection_name)
 
-    def upsert_vectors(self, tenant_id: str, project_id: str, vectors: list, payloads: list, ids: list):
+    def upsert_vectors(
+        self,
+        tenant_id: str,
+        project_id: str,
+        vectors: list,
+        payloads: list,
+        ids: list,
+        wait: bool = True,
+        collection_name: Optional[str] = None
+    ):
         """Upserts vectors into the specific tenant-project collection."""
-        collection_name = self._get_collection_name(tenant_id, project_id)
-        self.ensure_collection_exists(tenant_id, project_id)
-        
+        from qdrant_client.http import models
+
+        collection_name = collection_name or self._get_collection_name(tenant_id, project_id)
+        self.ensure_collection_exists(tenant_id, project_id, collection_name=collection_name, dim=len(vectors[0]) if vectors else None)
+
         self.client.upsert(
             collection_name=collection_name,
             points=models.Batch(
                 ids=ids,
                 vectors=vectors,
                 payloads=payloads
-            )
+            ),
+            wait=wait
         )
 
-    def search(self, tenant_id: str, project_id: str, query_vector: list, limit: int = 5):
+    def iter_points(
+        self,
+        tenant_id: str,
+        project_id: str,
+        page_size: int = 1000,
+        with_vectors: bool = False,
+        with_payload=True,
+        collection_name: Optional[str] = None,
+        offset=None,
+        scroll_filter=None
+    ):
+        """
+        Streams the collection page by page with scroll; yields (records, next_offset)
+        so callers can checkpoint and resume.
+        """
+        collection_name = collection_name or self._get_collection_name(tenant_id, project_id)
+        if not self._collection_exists(collection_name):
+            return
+
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+                scroll_filter=scroll_filter
+            )
+            if points:
+                yield points, offset
+            if offset is None:
+                break
+
+    def count(self, collection_name: str) -> int:
+        if not self._collection_exists(collection_name):
+            return 0
+        return self.client.count(collection_name=collection_name, exact=True).count
+
+    def search(
+        self,
+        tenant_id: str,
+        project_id: str,
+        query_vector: list,
+        limit: int = 5,
+        collection_name: Optional[str] = None,
+        query_filter=None
+    ):
         """Searches for similar vectors in the specific tenant-project collection."""
-        collection_name = self._get_collection_name(tenant_id, project_id)
-        
+        collection_name = collection_name or self._get_collection_name(tenant_id, project_id)
+
         # If collection doesn't exist, return empty list
         if not self._collection_exists(collection_name):
             return []
 
-        return self.client.search(
+        from qdrant_client.http.exceptions import UnexpectedResponse
+
+        try:
+            return self.client.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=limit,
+                query_filter=query_filter
+            )
+        except UnexpectedResponse as e:
+            # Dropped by another worker (e.g. the reconciler) since we cached it.
+            if e.status_code != 404:
+                raise
+            self._known_collections.discard(collection_name)
+            self._indexed_collections.discard(collection_name)
+            return []
+
+    def delete_vectors_by_doc_id(self, tenant_id: str, project_id: str, doc_id: str, collection_name: Optional[str] = None):
+        """Deletes vectors associated with a specific document ID."""
+        self.delete_vectors_by_doc_ids(tenant_id, project_id, [doc_id], collection_name=collection_name)
+
+    def delete_vectors_by_doc_ids(self, tenant_id: str, project_id: str, doc_ids: list, collection_name: Optional[str] = None):
+        """Bulk variant of delete_vectors_by_doc_id for many documents in one request."""
+        from qdrant_client.http import models
+
+        collection_name = collection_name or self._get_collection_name(tenant_id, project_id)
+        if not doc_ids or not self._collection_exists(collection_name):
+            return
+
+        self.client.delete(
             collection_name=collection_name,
-            query_vector=query_vector,
-            limit=limit
+            points_selector=models.FilterSelector(filter=self.doc_id_filter(doc_ids))
         )
 
-    def delete_vectors_by_doc_id(self, tenant_id: str, project_id: str, doc_id: str):
-        """Deletes vectors associated with a specific document ID."""
-        collection_name = self._get_collection_name(tenant_id, project_id)
+    def doc_id_filter(self, doc_ids: list):
+        """
+        Matches every chunk referencing any of the given documents. Shared (deduplicated)
+        chunks list all their documents in `doc_ids`; older points only carry `doc_id`.
+        """
+        from qdrant_client.http import models
+
+        return models.Filter(
+            should=[
+                models.FieldCondition(
+                    key="doc_ids",
+                    match=models.MatchAny(any=doc_ids)
+                ),
+                models.FieldCondition(
+                    key="doc_id",
+                    match=models.MatchAny(any=doc_ids)
+                )
+            ]
+        )
+
+    def payload_filter(
+        self,
+        doc_ids: Optional[list] = None,
+        title_prefix: Optional[str] = None,
+        tags: Optional[list] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        updated_after: Optional[datetime] = None,
+        updated_before: Optional[datetime] = None
+    ):
+        """
+        Builds a search filter over the indexed chunk metadata; None if nothing is set.
+        Conditions are ANDed; tags and doc_ids match any of the given values.
+        """
+        from qdrant_client.http import models
+
+        must = []
+        if doc_ids:
+            must.append(self.doc_id_filter([str(d) for d in doc_ids]))
+        if title_prefix and title_prefix.strip():
+            must.append(models.FieldCondition(
+                key="title_prefixes",
+                match=models.MatchValue(value=title_prefix.strip().lower()[:TITLE_PREFIX_MAX_LEN])
+            ))
+        if normalize_tags(tags):
+            must.append(models.FieldCondition(
+                key="tags",
+                match=models.MatchAny(any=normalize_tags(tags))
+            ))
+        for key, after, before in (
+            ("created_at", created_after, created_before),
+            ("updated_at", updated_after, updated_before),
+        ):
+            if after or before:
+                must.append(models.FieldCondition(
+                    key=key,
+                    range=models.Range(
+                        gte=to_timestamp(after) if after else None,
+                        lte=to_timestamp(before) if before else None
+                    )
+                ))
+        return models.Filter(must=must) if must else None
+
+    def retrieve_points(self, collection_name: str, ids: list, with_payload=True) -> list:
+        if not ids or not self._collection_exists(collection_name):
+            return []
+        return self.client.retrieve(collection_name=collection_name, ids=ids, with_payload=with_payload)
+
+    def set_point_payload(self, collection_name: str, point_id: str, payload: dict):
+        """Updates payload keys of one point; a no-op if the point doesn't exist in this collection."""
+        from qdrant_client.http import models
+
         if not self._collection_exists(collection_name):
             return
+        self.client.set_payload(
+            collection_name=collection_name,
+            payload=payload,
+            points=models.Filter(must=[models.HasIdCondition(has_id=[point_id])])
+        )
+
+    def delete_points(self, collection_name: str, ids: list):
+        from qdrant_client.http import models
 
+        if not ids or not self._collection_exists(collection_name):
+            return
         self.client.delete(
             collection_name=collection_name,
-            points_selector=models.FilterSelector(
-                filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="doc_id",
-                            match=models.MatchValue(value=doc_id)
-                        )
-                    ]
-                )
-            )
+            points_selector=models.PointIdsList(points=ids)
         )
 
-    def _collection_exists(self, collection_name: str) -> bool:
-        """Compatibility helper for older qdrant-client versions."""
-        collections = self.client.get_collections().collections
-        return any(c.name == collection_name for c in collections)
+    def delete_collection(self, collection_name: str):
+        if self._collection_exists(collection_name):
+            self.client.delete_collection(collection_name=collection_name)
+        self._known_collections.discard(collection_name)
+        self._indexed_collections.discard(collection_name)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
-vector_service = VectorService()
+    def _collection_exists(self, collection_name: str) -> bool:
+        """Checks the local registry first, falling back to Qdrant on a miss."""
+        if collection_name in self._known_collections:
+            return True
+        return collection_name in self.refresh_collections()
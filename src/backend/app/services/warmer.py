@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.db import models
+from app.services.admission import AdmissionService
+from app.services.cache import CacheService
+from app.services.index import IndexRegistry
+from app.services.rag import CHANGED_PROJECTS_KEY, RagService
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WarmReport:
+    projects: int = 0
+    questions_warmed: int = 0
+    already_cached: int = 0
+    over_budget: int = 0
+    embedding_tokens: int = 0
+    errors: List[str] = field(default_factory=list)
+    failed_projects: List[str] = field(default_factory=list)
+
+class CacheWarmerService:
+    """
+    Pre-computes retrievals for the questions each project is asked most often, so
+    the first users after a deploy, a Redis flush or a corpus change hit a warm cache.
+
+    Questions are mined from chat_logs (top WARM_TOP_QUESTIONS per project over the
+    last WARM_LOOKBACK_DAYS, asked at least WARM_MIN_COUNT times) with one query and
+    retrieved in batches through RagService.retrieve_many under an ingest slot, so
+    warming always yields to chat. Only retrievals are warmed: answers are never
+    pre-generated, so the spend is embedding tokens, capped per tenant per day by
+    WARM_TENANT_DAILY_TOKENS.
+    """
+    def __init__(self, rag: RagService, index: IndexRegistry, cache: CacheService, admission: AdmissionService):
+        self.rag = rag
+        self.index = index
+        self.cache = cache
+        self.admission = admission
+
+    def _budget_key(self, tenant_id: str) -> str:
+        return f"warm:budget:{tenant_id}:{datetime.now(timezone.utc):%Y%m%d}"
+
+    async def run(
+        self,
+        tenant_id: Optional[str] = None,
+        project_ids: Optional[Set[str]] = None,
+        refresh: bool = False
+    ) -> WarmReport:
+        """
+        Warms the given projects (default: every project with recent chat history).
+        `refresh` recomputes entries that are already cached, for projects whose
+        corpus changed.
+        """
+        report = WarmReport()
+        questions = await self._top_questions(tenant_id, project_ids)
+        for (project_tenant, project_id), texts in questions.items():
+            report.projects += 1
+            try:
+                await self._warm_project(project_tenant, project_id, texts, refresh, report)
+            except Exception as e:
+                logger.exception("Cache warm-up failed for project %s", project_id)
+                report.errors.append(f"{project_id}: {e}")
+                report.failed_projects.append(project_id)
+        logger.info(
+            "Cache warm-up: %d projects, %d questions warmed, %d already cached, %d over budget",
+            report.projects, report.questions_warmed, report.already_cached, report.over_budget
+        )
+        return report
+
+    async def _top_questions(self, tenant_id: Optional[str], project_ids: Optional[Set[str]]) -> Dict[tuple, List[str]]:
+        since = datetime.now(timezone.utc) - timedelta(days=settings.WARM_LOOKBACK_DAYS)
+        asked = func.count().label("asked")
+        # Follow-ups are retrieved (and cached) under their standalone rewrite.
+        question = func.coalesce(models.ChatLog.standalone_question, models.ChatLog.question).label("question")
+        ranked = (
+            select(
+                models.Project.tenant_id,
+                models.ChatLog.project_id,
+                question,
+                asked,
+                func.row_number().over(
+                    partition_by=models.ChatLog.project_id, order_by=func.count().desc()
+                ).label("rank"),
+            )
+            .join(models.Project, models.Project.id == models.ChatLog.project_id)
+            .where(models.ChatLog.created_at >= since)
+            .group_by(models.Project.tenant_id, models.ChatLog.project_id, question)
+            .having(func.count() >= settings.WARM_MIN_COUNT)
+        )
+        if tenant_id:
+            ranked = ranked.where(models.Project.tenant_id == uuid.UUID(tenant_id))
+        if project_ids:
+            ranked = ranked.where(models.ChatLog.project_id.in_([uuid.UUID(p) for p in project_ids]))
+        ranked = ranked.subquery()
+
+        async with self.index.session_factory() as db:
+            rows = (await db.execute(
+                select(ranked.c.tenant_id, ranked.c.project_id, ranked.c.question)
+                .where(ranked.c.rank <= settings.WARM_TOP_QUESTIONS)
+                .order_by(ranked.c.project_id, ranked.c.rank)
+            )).all()
+
+        questions: Dict[tuple, List[str]] = {}
+        for row in rows:
+            questions.setdefault((str(row.tenant_id), str(row.project_id)), []).append(row.question)
+        return questions
+
+    async def _warm_project(self, tenant_id: str, project_id: str, questions: List[str], refresh: bool, report: WarmReport):
+        # 1. Skip what is already cached (unless the corpus changed)
+        if not refresh:
+            info = await self.index.resolve(tenant_id, project_id)
+            cached = await self.cache.get_many([self.rag.cache_key(info, q, {}, settings.RAG_TOP_K) for q in questions])
+            report.already_cached += sum(1 for c in cached if c)
+            questions = [q for q, c in zip(questions, cached) if not c]
+        if not questions:
+            return
+
+        # 2. Reserve embedding tokens from the tenant's daily budget, most frequent first.
+        # Everything is reserved with one INCRBY and the excess refunded, so concurrent
+        # warmers (admin call, other workers) can never overspend together.
+        budget_key = self._budget_key(tenant_id)
+        costs = [self.rag.count_tokens([question]) for question in questions]
+        pipe = self.cache.redis.pipeline(transaction=False)
+        pipe.incrby(budget_key, sum(costs))
+        pipe.expire(budget_key, 2 * 24 * 3600)
+        spent, _ = await pipe.execute()
+        allowed = sum(costs) - max(0, spent - settings.WARM_TENANT_DAILY_TOKENS)
+        selected, tokens = [], 0
+        for question, cost in zip(questions, costs):
+            if tokens + cost > allowed:
+                report.over_budget += len(questions) - len(selected)
+                break
+            selected.append(question)
+            tokens += cost
+        if tokens < sum(costs):
+            await self.cache.redis.decrby(budget_key, sum(costs) - tokens)
+        if not selected:
+            return
+
+        # 3. Retrieve in one batch, yielding to chat
+        try:
+            async with self.admission.ingest_slot():
+                await self.rag.retrieve_many(
+                    tenant_id,
+                    project_id,
+                    selected,
+                    limit=settings.RAG_TOP_K,
+                    concurrency=settings.WARM_SEARCH_CONCURRENCY,
+                    refresh=True
+                )
+        except Exception:
+            await self.cache.redis.decrby(budget_key, tokens)
+            raise
+        report.questions_warmed += len(selected)
+        report.embedding_tokens += tokens
+
+    async def run_forever(self):
+        """
+        Refreshes projects flagged by ingestion, deletes and re-index cut-overs, and
+        tops up every project's popular questions, whenever chat is quiet.
+        """
+        chat = self.admission.pools["chat"]
+        while True:
+            await asyncio.sleep(settings.WARM_INTERVAL_SECONDS)
+            if chat.in_flight > chat.limit // 2:
+                continue
+            try:
+                changed = await self.cache.redis.spop(CHANGED_PROJECTS_KEY, 1000)
+                if changed:
+                    try:
+                        report = await self.run(project_ids=set(changed), refresh=True)
+                    except Exception:
+                        # Put the flags back so the next pass refreshes these projects.
+                        await self.cache.redis.sadd(CHANGED_PROJECTS_KEY, *changed)
+                        raise
+                    if report.failed_projects:
+                        await self.cache.redis.sadd(CHANGED_PROJECTS_KEY, *report.failed_projects)
+                if await self._acquire_lock():
+                    await self.run()
+            except Exception:
+                logger.exception("Scheduled cache warm-up failed")
+
+    async def warm_after_deploy(self):
+        """Startup pass (after the container's warm-up); one worker does it."""
+        try:
+            if await self._acquire_lock():
+                await self.run()
+        except Exception:
+            logger.exception("Startup cache warm-up failed")
+
+    async def _acquire_lock(self) -> bool:
+        # Keeps the full pass to one worker per interval.
+        return bool(await self.cache.redis.set("warm:lock", "1", nx=True, ex=max(60, settings.WARM_INTERVAL_SECONDS - 1)))
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import uuid
+from pathlib import Path
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db import models
+from app.services.cache import CacheService
+from app.services.dedup import DedupService
+from app.services.evaluation import EvaluationService, load_questions
+from app.services.index import IndexRegistry
+from app.services.rag import RagService
+from app.services.vector import VectorService
+
+def default_questions() -> str:
+    """test_data/eval_questions.jsonl from a checkout, else the copy mounted at /test_data in the container."""
+    here = Path(__file__).resolve()
+    for root in list(here.parents)[1:3] + [Path("/")]:
+        candidate = root / "test_data" / "eval_questions.jsonl"
+        if candidate.exists():
+            return str(candidate)
+    return "/test_data/eval_questions.jsonl"
+
+async def load_corpus(async_session, rag: RagService, project: models.Project, directory: Path) -> int:
+    """Uploads every .txt/.md file as a document titled after its file name; existing titles are skipped."""
+    async with async_session() as db:
+        existing = set((await db.execute(
+            select(models.Document.title).where(models.Document.project_id == project.id)
+        )).scalars().all())
+        loaded = 0
+        for path in sorted(directory.iterdir()):
+            if path.suffix not in (".txt", ".md") or path.stem in existing:
+                continue
+            doc = models.Document(project_id=project.id, title=path.stem, content=path.read_text(encoding="utf-8"))
+            db.add(doc)
+            await db.commit()
+            await db.refresh(doc)
+            await rag.ingest_document(
+                tenant_id=str(project.tenant_id),
+                project_id=str(project.id),
+                doc_id=str(doc.id),
+                content=doc.content,
+                title=doc.title,
+                tags=doc.tags,
+                created_at=doc.created_at,
+                updated_at=doc.updated_at
+            )
+            print(f"   📄 Loaded {path.name}")
+            loaded += 1
+    return loaded
+
+async def run(args):
+    engine = create_async_engine(settings.DATABASE_URL)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    cache = CacheService()
+    vector = VectorService()
+    index = IndexRegistry(session_factory=async_session)
+    rag = RagService(cache=cache, vector=vector, index=index, dedup=DedupService(cache=cache))
+
+    try:
+        async with async_session() as db:
+            project = await db.get(models.Project, args.project_id)
+        if not project:
+            raise SystemExit(f"Project {args.project_id} not found")
+
+        if args.load_corpus:
+            loaded = await load_corpus(async_session, rag, project, Path(args.load_corpus))
+            print(f"✅ Corpus ready ({loaded} new documents)")
+
+        with open(args.questions or default_questions(), encoding="utf-8") as src:
+            questions = load_questions(src)
+
+        report = await EvaluationService(rag).run(
+            str(project.tenant_id),
+            str(project.id),
+            questions,
+            top_k=args.top_k,
+            generate=args.generate,
+            search_concurrency=args.concurrency,
+            answer_concurrency=args.answer_concurrency,
+            use_cache=args.use_cache
+        )
+    finally:
+        vector.close()
+        await cache.close()
+        await engine.dispose()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            for result in report["results"]:
+                out.write(json.dumps(result) + "\n")
+
+    summary = report["summary"]
+    for result in report["results"]:
+        if result["hit"] is False:
+            print(f"   ❌ {result['id']}: expected {result['expected_sources']}, got {[s['title'] for s in result['sources']]}")
+    print(json.dumps(summary, indent=2))
+    if summary["hit_rate"] is not None:
+        print(f"✅ Hit rate @{summary['top_k']}: {summary['hit_rate']:.0%} over {summary['graded']} questions")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch question answering and retrieval evaluation for one project.")
+    parser.add_argument("project_id", type=uuid.UUID)
+    parser.add_argument("questions", nargs="?", help="JSONL file of questions (default: test_data/eval_questions.jsonl)")
+    parser.add_argument("--top-k", type=int, default=None, help=f"Chunks per question (default RAG_TOP_K={settings.RAG_TOP_K})")
+    parser.add_argument("--generate", action="store_true", help="Also generate answers (costs LLM tokens)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent vector searches")
+    parser.add_argument("--answer-concurrency", type=int, default=None, help="Concurrent LLM calls")
+    parser.add_argument("--use-cache", action="store_true", help="Read and fill the retrieval cache")
+    parser.add_argument("--load-corpus", metavar="DIR", help="Upload .txt/.md files from DIR first (e.g. ../../test_data)")
+    parser.add_argument("--output", help="Write per-question results (answers, sources, timings) as JSONL")
+
+    asyncio.run(run(parser.parse_args()))
@@ -10,22 +10,26 @@ async def get_users():
     async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
     async with async_session() as session:
-        # Get Tenants
-        result = await session.execute(select(Tenant))
-        tenants = result.scalars().all()
+        # Tenants and their users in one query
+        result = await session.execute(
+            select(Tenant, User)
+            .outerjoin(User, User.tenant_id == Tenant.id)
+            .order_by(Tenant.created_at, Tenant.id, User.created_at)
+        )
+        tenants = {}
+        for tenant, user in result.all():
+            users = tenants.setdefault(tenant.id, (tenant, []))[1]
+            if user is not None:
+                users.append(user)
 
         print("\n# 🧪 Test Data (Generated)\n")
         
-        for tenant in tenants:
+        for tenant, users in tenants.values():
             print(f"### Tenant: **{tenant.name}**")
             print(f"- **Tenant ID:** `{tenant.id}`")
             print("\n| Role | Name | Email | User ID | Department |")
             print("| :--- | :--- | :--- | :--- | :--- |")
             
-            # Get Users for this Tenant
-            users_result = await session.execute(select(User).where(User.tenant_id == tenant.id))
-            users = users_result.scalars().all()
-            
             for user in users:
                 print(f"| {user.role.capitalize()} | {user.full_name} | `{user.email}` | `{user.id}` | {user.department or '-'} |")
             print("\n")
@@ -0,0 +1,52 @@
+import argparse
+import asyncio
+import time
+import uuid
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.services.cache import CacheService
+from app.services.index import IndexRegistry
+from app.services.snapshot import SnapshotService
+from app.services.vector import VectorService
+
+async def run(args):
+    engine = create_async_engine(settings.DATABASE_URL)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    vector = VectorService()
+    cache = CacheService()
+    service = SnapshotService(vector, IndexRegistry(session_factory=async_session), cache, batch_size=args.batch_size)
+
+    started = time.perf_counter()
+    try:
+        async with async_session() as session:
+            if args.command == "export":
+                with open(args.path, "wb") as out:
+                    totals = await service.export_project(session, args.project_id, out)
+            else:
+                with open(args.path, "rb") as src:
+                    totals = await service.import_project(session, args.project_id, src)
+    finally:
+        vector.close()
+        await cache.close()
+        await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {args.command.capitalize()} complete: {totals['documents']} documents, {totals['points']} chunks in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import a project's knowledge base snapshot.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export", help="Write a project's documents and vectors to an archive")
+    export_cmd.add_argument("project_id", type=uuid.UUID)
+    export_cmd.add_argument("path")
+
+    import_cmd = sub.add_parser("import", help="Load an archive into an existing project (no re-embedding)")
+    import_cmd.add_argument("project_id", type=uuid.UUID)
+    import_cmd.add_argument("path")
+
+    for cmd in (export_cmd, import_cmd):
+        cmd.add_argument("--batch-size", type=int, default=1000)
+
+    asyncio.run(run(parser.parse_args()))
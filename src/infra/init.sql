@@ -38,6 +38,40 @@ CREATE TABLE IF NOT EXISTS documents (
     title TEXT NOT NULL,
     content TEXT NOT NULL, -- Original text/markdown
     file_path TEXT, -- Optional, if we store files
+    tags TEXT[] NOT NULL DEFAULT '{}', -- Free-form labels, filterable at retrieval
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Vector index per project: active collection + embedding model, and any in-flight re-index (shadow)
+CREATE TABLE IF NOT EXISTS project_indexes (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    collection_name TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    embedding_dim INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    shadow_collection_name TEXT,
+    shadow_embedding_model TEXT,
+    shadow_embedding_dim INTEGER,
+    retired_collection_name TEXT,
+    reindex_status TEXT, -- 'running', 'completed', 'failed', 'aborted'
+    reindex_cursor TEXT, -- Qdrant scroll offset to resume from
+    reindex_done INTEGER NOT NULL DEFAULT 0,
+    reindex_total INTEGER NOT NULL DEFAULT 0,
+    reindex_error TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Multi-turn chat: rolling summary of older turns plus the latest turn verbatim
+CREATE TABLE IF NOT EXISTS conversations (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_turns INTEGER NOT NULL DEFAULT 0, -- Turns folded into the summary
+    turns INTEGER NOT NULL DEFAULT 0,
+    last_question TEXT,
+    last_answer TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -47,15 +81,57 @@ CREATE TABLE IF NOT EXISTS chat_logs (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID REFERENCES users(id) ON DELETE SET NULL,
     project_id UUID REFERENCES projects(id) ON DELETE SET NULL,
+    conversation_id UUID REFERENCES conversations(id) ON DELETE SET NULL,
     question TEXT NOT NULL,
+    standalone_question TEXT, -- Follow-up as rewritten for retrieval
     answer TEXT NOT NULL,
     sources JSONB, -- List of cited sources
+    cache_hit BOOLEAN, -- Retrieval served from Redis
+    latency_ms INTEGER, -- End-to-end chat latency
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Reporting rollups, updated incrementally from chat_logs (see AnalyticsService)
+CREATE TABLE IF NOT EXISTS chat_stats_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    questions INTEGER NOT NULL DEFAULT 0,
+    cache_lookups INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    latency_ms_sum BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day)
+);
+
+-- Latency histogram per day; bucket b covers up to 2^((b+1)/4) ms
+CREATE TABLE IF NOT EXISTS chat_latency_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    bucket SMALLINT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS chat_citations_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    title TEXT NOT NULL,
+    citations INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day, title)
+);
+
+-- Rollup progress: chat_logs rows up to the watermark have been aggregated
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+    name TEXT PRIMARY KEY,
+    watermark TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
 -- Create indexes for performance
 CREATE INDEX idx_users_tenant_id ON users(tenant_id);
 CREATE INDEX idx_projects_tenant_id ON projects(tenant_id);
 CREATE INDEX idx_documents_project_id ON documents(project_id);
 CREATE INDEX idx_chat_logs_user_id ON chat_logs(user_id);
 CREATE INDEX idx_chat_logs_project_id ON chat_logs(project_id);
+CREATE INDEX idx_chat_logs_project_created_at ON chat_logs(project_id, created_at);
+CREATE INDEX idx_chat_logs_created_at ON chat_logs(created_at);
+CREATE INDEX idx_chat_logs_conversation_id ON chat_logs(conversation_id);
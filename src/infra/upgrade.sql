@@ -0,0 +1,81 @@
+-- Brings a database created from an older init.sql up to the current schema.
+-- init.sql only runs on an empty data volume; this script is idempotent and safe to re-run.
+
+-- Documents: retrieval filter labels
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS tags TEXT[] NOT NULL DEFAULT '{}';
+
+-- Vector index per project (rows for existing projects are created on first use)
+CREATE TABLE IF NOT EXISTS project_indexes (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    collection_name TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    embedding_dim INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    shadow_collection_name TEXT,
+    shadow_embedding_model TEXT,
+    shadow_embedding_dim INTEGER,
+    retired_collection_name TEXT,
+    reindex_status TEXT,
+    reindex_cursor TEXT,
+    reindex_done INTEGER NOT NULL DEFAULT 0,
+    reindex_total INTEGER NOT NULL DEFAULT 0,
+    reindex_error TEXT,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Multi-turn chat
+CREATE TABLE IF NOT EXISTS conversations (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_turns INTEGER NOT NULL DEFAULT 0,
+    turns INTEGER NOT NULL DEFAULT 0,
+    last_question TEXT,
+    last_answer TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Chat logs: conversation link and reporting columns
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS conversation_id UUID REFERENCES conversations(id) ON DELETE SET NULL;
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS standalone_question TEXT;
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS cache_hit BOOLEAN;
+ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS latency_ms INTEGER;
+
+-- Reporting rollups
+CREATE TABLE IF NOT EXISTS chat_stats_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    questions INTEGER NOT NULL DEFAULT 0,
+    cache_lookups INTEGER NOT NULL DEFAULT 0,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    latency_ms_sum BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS chat_latency_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    bucket SMALLINT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS chat_citations_daily (
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    title TEXT NOT NULL,
+    citations INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day, title)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+    name TEXT PRIMARY KEY,
+    watermark TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_logs_project_created_at ON chat_logs(project_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_chat_logs_created_at ON chat_logs(created_at);
+CREATE INDEX IF NOT EXISTS idx_chat_logs_conversation_id ON chat_logs(conversation_id);